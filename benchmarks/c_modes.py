@@ -0,0 +1,129 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "examples"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from c_lexer import tokens  # noqa: E402
+
+from derivatives import make_lexer, select_first  # noqa: E402
+from derivatives.codegen import C_MODES, generate_c  # noqa: E402
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+INPUT_SIZE = 16 << 20
+
+REPEAT = 5
+
+DRIVER = r"""
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+#include "lexer.h"
+
+int main(int argc, char **argv) {
+    FILE *fp = fopen(argv[1], "rb");
+    long size;
+    char *data;
+    struct DfaMatch match;
+    unsigned long count = 0, checksum = 0;
+    double best = 1e9;
+    int i;
+
+    fseek(fp, 0, SEEK_END);
+    size = ftell(fp);
+    fseek(fp, 0, SEEK_SET);
+    data = malloc(size + 1);
+    if (fread(data, 1, size, fp) != (size_t)size) { return 1; }
+    data[size] = 0;
+    fclose(fp);
+
+    for (i = 0; i < REPEAT; ++i) {
+        struct timespec t0, t1;
+        const char *s = data;
+        double elapsed;
+
+        count = checksum = 0;
+        clock_gettime(CLOCK_MONOTONIC, &t0);
+        while (s != data + size) {
+#ifdef DFA_USE_LIMIT
+            dfa_match(s, data + size, &match);
+#else
+            dfa_match(s, &match);
+#endif
+            if (match.token == DFA_INVALID_TOKEN) { return 2; }
+            checksum = checksum * 31 + match.token * (match.end - data);
+            count += 1;
+            s = match.end;
+        }
+        clock_gettime(CLOCK_MONOTONIC, &t1);
+        elapsed = (t1.tv_sec - t0.tv_sec) + (t1.tv_nsec - t0.tv_nsec) * 1e-9;
+        if (elapsed < best) { best = elapsed; }
+    }
+    printf("%lu %lu %f\n", count, checksum, best);
+    return 0;
+}
+"""
+
+
+def make_input(size: int = INPUT_SIZE) -> bytes:
+    source = b""
+    for name in sorted(os.listdir(EXAMPLES)):
+        if name.endswith(".c"):
+            with open(os.path.join(EXAMPLES, name), "rb") as fp:
+                source += b"".join(
+                    line for line in fp.readlines()
+                    if not line.startswith(b"#")
+                )
+    return source * (size // len(source) + 1)
+
+
+def run(directory: str, header: str, limit: bool) -> str:
+    with open(os.path.join(directory, "lexer.h"), "w") as fp:
+        fp.write(header)
+    binary = os.path.join(directory, "lexer")
+    subprocess.run(
+        [
+            os.environ.get("CC", "cc"), "-O2", "-DREPEAT={}".format(REPEAT),
+            *(["-DDFA_USE_LIMIT"] if limit else []),
+            "-o", binary, os.path.join(directory, "driver.c"),
+        ],
+        check=True,
+    )
+    return subprocess.run(
+        [binary, os.path.join(directory, "input")],
+        check=True, stdout=subprocess.PIPE,
+    ).stdout.decode("ascii")
+
+
+def main() -> None:
+    lexer = make_lexer(tokens(), select_first)
+    data = make_input()
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "input"), "wb") as fp:
+            fp.write(data)
+        with open(os.path.join(directory, "driver.c"), "w") as fp:
+            fp.write(DRIVER)
+        expected = None
+        for mode in C_MODES:
+            header = generate_c(lexer, mode)
+            for limit in (False, True):
+                output = run(directory, header, limit)
+                count, checksum, elapsed = output.split()
+                if expected is None:
+                    expected = (count, checksum)
+                elif expected != (count, checksum):
+                    raise RuntimeError("Mode {} disagrees".format(mode))
+                print(
+                    "{:<8} {:<6} header={:<8} tokens={} {:.1f} MB/s".format(
+                        mode, "limit" if limit else "null", len(header),
+                        count, len(data) / float(elapsed) / 1e6
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
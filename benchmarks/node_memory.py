@@ -0,0 +1,44 @@
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "examples"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from c_lexer import tokens  # noqa: E402
+
+from derivatives import make_lexer, select_first  # noqa: E402
+from derivatives.core import interned_nodes  # noqa: E402
+
+
+def node_size(node: object) -> int:
+    size = sys.getsizeof(node)
+    if hasattr(node, "__dict__"):
+        size += sys.getsizeof(node.__dict__)
+    return size
+
+
+def report(label: str) -> None:
+    current, peak = tracemalloc.get_traced_memory()
+    nodes = list(interned_nodes())
+    node_bytes = sum(node_size(node) for node in nodes)
+    print(
+        "{:<12} nodes={:<7} node_bytes={:<9} per_node={:<7.1f} "
+        "traced={:<9} peak={}".format(
+            label, len(nodes), node_bytes, node_bytes / max(len(nodes), 1),
+            current, peak
+        )
+    )
+
+
+def main() -> None:
+    tracemalloc.start()
+    grammar = tokens()
+    report("tokens")
+    lexer = make_lexer(grammar, select_first)
+    report("make_lexer")
+    del lexer
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "examples"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import c_lexer  # noqa: E402
+import matcher  # noqa: E402
+from c_modes import make_input  # noqa: E402
+
+from derivatives import (  # noqa: E402
+    Regex, any_without, char, char_range, char_set, empty, generate_c,
+    generate_dot, make_lexer, select_first, string
+)
+from derivatives.core import clear_caches  # noqa: E402
+
+SUITE_VERSION = 1
+
+CORPUS_SIZE = 1 << 20
+
+REPEAT = 3
+
+SEED = 0
+
+Tokens = List[Tuple[str, Regex]]
+
+
+class Case(NamedTuple):
+    name: str
+    tokens: Callable[[], Tokens]
+    corpus: Optional[Callable[[int], bytes]]
+
+
+def repeat_words(words: List[bytes], size: int) -> bytes:
+    rng = random.Random(SEED)
+    chunks: List[bytes] = []
+    total = 0
+    while total < size:
+        word = rng.choice(words)
+        chunks.append(word)
+        total += len(word)
+    return b"".join(chunks)
+
+
+def keyword_names(count: int) -> List[str]:
+    rng = random.Random(SEED)
+    names = set()
+    while len(names) < count:
+        names.add("".join(
+            rng.choice("abcdefghijklmnopqrstuvwxyz")
+            for _ in range(rng.randint(2, 10))
+        ))
+    return sorted(names)
+
+
+def keyword_tokens(count: int) -> Tokens:
+    tokens = [(name, string(name)) for name in keyword_names(count)]
+    tokens.append(("ident", char_range("a", "z").plus()))
+    tokens.append(("space", char_set(" \n").plus()))
+    return tokens
+
+
+def keyword_union_tokens(count: int) -> Tokens:
+    keywords = empty()
+    for name in keyword_names(count):
+        keywords |= string(name)
+    return [
+        ("keyword", keywords),
+        ("ident", char_range("a", "z").plus()),
+        ("space", char_set(" \n").plus()),
+    ]
+
+
+def keyword_corpus(count: int, size: int) -> bytes:
+    words = [name.encode() for name in keyword_names(count)]
+    return repeat_words(
+        [word + b" " for word in words] + [b"other ", b"\n"], size
+    )
+
+
+def nested_tokens(depth: int) -> Tokens:
+    regex = string("ab")
+    for _ in range(depth):
+        regex = char("<") * any_without(regex) * char(">")
+    return [
+        ("nested", regex),
+        ("word", char_set("ab<>").plus()),
+        ("space", char(" ").plus()),
+    ]
+
+
+def unicode_ranges(count: int) -> List[Tuple[int, int]]:
+    step = (0x10000 - 0x100) // count
+    return [
+        (0x100 + i * step, 0x100 + (i + 1) * step - 1) for i in range(count)
+    ]
+
+
+def unicode_tokens(count: int) -> Tokens:
+    tokens = [
+        ("class{}".format(i), char_range(chr(start), chr(end)).plus())
+        for i, (start, end) in enumerate(unicode_ranges(count))
+    ]
+    tokens.append(("space", char(" ").plus()))
+    return tokens
+
+
+def unicode_corpus(count: int, size: int) -> bytes:
+    rng = random.Random(SEED)
+    words: List[bytes] = []
+    for start, end in unicode_ranges(count):
+        chars = [
+            code for code in range(start, end + 1)
+            if not 0xD800 <= code <= 0xDFFF
+        ]
+        if not chars:
+            continue
+        for _ in range(10):
+            words.append("".join(
+                chr(rng.choice(chars)) for _ in range(rng.randint(1, 8))
+            ).encode("utf-8") + b" ")
+    return repeat_words(words, size)
+
+
+def matcher_corpus(size: int) -> bytes:
+    return b"abb" * (size // 3)
+
+
+CASES = [
+    Case("c_lexer", c_lexer.tokens, make_input),
+    Case("matcher", matcher.tokens, matcher_corpus),
+    *(
+        Case(
+            "keywords_{}".format(count),
+            lambda count=count: keyword_tokens(count),
+            lambda size, count=count: keyword_corpus(count, size),
+        )
+        for count in (10, 100, 1000)
+    ),
+    *(
+        Case(
+            "keyword_union_{}".format(count),
+            lambda count=count: keyword_union_tokens(count),
+            lambda size, count=count: keyword_corpus(count, size),
+        )
+        for count in (100, 1000)
+    ),
+    *(
+        Case(
+            "nested_any_without_{}".format(depth),
+            lambda depth=depth: nested_tokens(depth),
+            None,
+        )
+        for depth in (1, 2, 3, 4)
+    ),
+    *(
+        Case(
+            "unicode_{}".format(count),
+            lambda count=count: unicode_tokens(count),
+            lambda size, count=count: unicode_corpus(count, size),
+        )
+        for count in (4, 16, 64)
+    ),
+]
+
+
+def best_of(repeat: int, func: Callable[[], Any]) -> Tuple[float, Any]:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def make_cold_lexer(tokens: Tokens, minimize: bool = False) -> Any:
+    clear_caches()
+    return make_lexer(tokens, select_first, minimize=minimize)
+
+
+def run_case(case: Case, repeat: int, corpus_size: int) -> Dict[str, Any]:
+    tokens = case.tokens()
+    make_time, lexer = best_of(repeat, lambda: make_cold_lexer(tokens))
+    minimize_time, minimized = best_of(
+        repeat, lambda: make_cold_lexer(tokens, True)
+    )
+    generate_c_time, header = best_of(repeat, lambda: generate_c(lexer))
+    generate_dot_time, dot = best_of(repeat, lambda: generate_dot(lexer))
+    result = {
+        "name": case.name,
+        "token_rules": len(tokens),
+        "make_lexer_s": make_time,
+        "make_lexer_minimize_s": minimize_time,
+        "states": len(list(lexer.iter_states())),
+        "minimized_states": len(list(minimized.iter_states())),
+        "byte_classes": max(lexer.get_byte_classes()) + 1,
+        "generate_c_s": generate_c_time,
+        "generate_c_bytes": len(header),
+        "generate_dot_s": generate_dot_time,
+        "generate_dot_bytes": len(dot),
+        "corpus_bytes": None,
+        "tokens": None,
+        "scan_s": None,
+        "scan_mb_s": None,
+    }
+    if case.corpus is not None:
+        corpus = case.corpus(corpus_size)
+        lexer.get_table()
+        scan_time, token_count = best_of(
+            repeat, lambda: sum(1 for _ in lexer.scan_all(corpus))
+        )
+        result.update({
+            "corpus_bytes": len(corpus),
+            "tokens": token_count,
+            "scan_s": scan_time,
+            "scan_mb_s": len(corpus) / scan_time / 1e6,
+        })
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], check=True, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, cwd=os.path.dirname(__file__) or "."
+        ).stdout.decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("cases", nargs="*", help="case names to run")
+    parser.add_argument("-o", "--output", help="write JSON results here")
+    parser.add_argument("-r", "--repeat", type=int, default=REPEAT)
+    parser.add_argument("-s", "--corpus-size", type=int, default=CORPUS_SIZE)
+    args = parser.parse_args()
+
+    names = {case.name for case in CASES}
+    for name in args.cases:
+        if name not in names:
+            parser.error("unknown case: {}".format(name))
+
+    results = []
+    for case in CASES:
+        if args.cases and case.name not in args.cases:
+            continue
+        result = run_case(case, args.repeat, args.corpus_size)
+        print(
+            "{:<24} states={:<5} make={:.3f}s scan={} c={:.3f}s "
+            "dot={:.3f}s".format(
+                case.name, result["states"], result["make_lexer_s"],
+                "-" if result["scan_mb_s"] is None
+                else "{:.2f}MB/s".format(result["scan_mb_s"]),
+                result["generate_c_s"], result["generate_dot_s"]
+            ),
+            file=sys.stderr
+        )
+        results.append(result)
+
+    report = {
+        "suite_version": SUITE_VERSION,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "corpus_size": args.corpus_size,
+        "results": results,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+            fp.write("\n")
+
+
+if __name__ == "__main__":
+    main()
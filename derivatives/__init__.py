@@ -1,13 +1,18 @@
 from .codegen import generate_c, generate_dot
-from .dfa import Dfa, make_dfa
+from .dfa import Dfa, DfaStats, TokenColumns, make_dfa
 from .edsl import (
     Regex, any_char, any_with, any_without, char, char_range, char_set, empty,
     epsilon, string
 )
-from .lexer import make_lexer, raise_on_conflict, select_first
+from .lazy import LazyDfa
+from .lexer import (
+    LexerBuilder, make_lazy_lexer, make_lexer, raise_on_conflict, select_first
+)
 
 __all__ = [
     "Regex", "Dfa", "make_dfa", "any_char", "any_with", "any_without", "char",
     "char_range", "char_set", "empty", "epsilon", "string", "make_lexer",
-    "raise_on_conflict", "select_first", "generate_c", "generate_dot"
+    "raise_on_conflict", "select_first", "generate_c", "generate_dot",
+    "LazyDfa", "make_lazy_lexer", "DfaStats", "LexerBuilder",
+    "TokenColumns"
 ]
@@ -1,10 +1,15 @@
 import html
+import struct
+import textwrap
 from collections import defaultdict
 from contextlib import contextmanager
 from io import StringIO
-from typing import Any, Dict, Iterator, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from .dfa import Dfa, DfaState, DfaTransition, DfaTransitions
+from .dfa import (
+    Dfa, DfaSelfLoop, DfaState, DfaTransition, DfaTransitions,
+    find_self_loops
+)
 from .partition import CHARSET_END
 
 
@@ -56,19 +61,23 @@ def generate_dot(dfa: Dfa) -> str:
         buf.line('"" -> "0"')
         buf.line('"end" [shape=doublecircle]')
 
+        names = dfa.get_tags()
         for state, data in dfa.iter_states():
             label = str(state)
-            if data.entry_tag:
-                label += "/" + data.entry_tag
+            if data.entry_tag is not None:
+                label += "/" + names[data.entry_tag]
             buf.line(
                 '"{}" [shape=circle fixedsize=shape label=<{}>]', state, label
             )
-            if data.eof_tag:
-                buf.line('"{}" -> "end" [label="EOF/{}"]', state, data.eof_tag)
+            if data.eof_tag is not None:
+                buf.line(
+                    '"{}" -> "end" [label="EOF/{}"]',
+                    state, names[data.eof_tag]
+                )
 
         for state, data in dfa.iter_states():
             grouped: Dict[
-                Tuple[Optional[int], Optional[str], bool],
+                Tuple[Optional[int], Optional[int], bool],
                 List[Tuple[int, int]]
             ] = defaultdict(list)
             last = 0
@@ -90,9 +99,9 @@ def generate_dot(dfa: Dfa) -> str:
                 label = "[{}]".format("".join(classes))
                 if tag is not None:
                     if at_exit:
-                        label += "/." + tag
+                        label += "/." + names[tag]
                     else:
-                        label += "/" + tag + "."
+                        label += "/" + names[tag] + "."
                 if target is not None:
                     buf.line('"{}" -> "{}" [label=<{}>]', state, target, label)
                 elif tag is not None:
@@ -106,13 +115,37 @@ def c_token_name(tag: str) -> str:
     return "DFA_T_" + tag.upper()
 
 
-def generate_c(dfa: Dfa) -> str:
+C_MODES = ("linear", "binary", "table")
+
+BINARY_LEAF_SIZE = 3
+
+TABLE_ROW_SIZE = 16
+
+C_SELF_LOOP_MIN_SIZE = 8
+
+
+DEAD_STATE = DfaState(
+    None, None, [DfaTransition(CHARSET_END, None, None, False)]
+)
+
+
+def with_dead_state(dfa: Dfa) -> Dfa:
+    if dfa.get_byte_classes():
+        return dfa
+    return Dfa([DEAD_STATE], dfa.get_tags())
+
+
+def generate_c(dfa: Dfa, mode: str = "linear") -> str:
+    if mode not in C_MODES:
+        raise ValueError("Unknown C generation mode: {}".format(mode))
+    dfa = with_dead_state(dfa)
     buf = Buffer(4)
 
     buf.line("#ifndef DERIVATIVES_DFA_H")
     buf.line("#define DERIVATIVES_DFA_H")
     buf.skip()
 
+    buf.line("#include <stddef.h>")
     buf.line("#include <stdint.h>")
     buf.skip()
 
@@ -127,7 +160,10 @@ def generate_c(dfa: Dfa) -> str:
     buf.line("};")
     buf.skip()
 
-    generate_c_match(buf, dfa)
+    if mode == "table":
+        generate_c_table_match(buf, dfa)
+    else:
+        generate_c_match(buf, dfa, mode == "binary")
     buf.skip()
 
     buf.line("#endif /* DERIVATIVES_DFA_H */")
@@ -154,7 +190,7 @@ def generate_c_tokens(buf: Buffer, dfa: Dfa) -> None:
     buf.line("};")
 
 
-def generate_c_match(buf: Buffer, dfa: Dfa) -> None:
+def generate_c_signature(buf: Buffer) -> None:
     buf.unindented("#ifdef DFA_USE_LIMIT")
     buf.line(
         "static inline void dfa_match(const char *s, const char *limit,"
@@ -165,6 +201,18 @@ def generate_c_match(buf: Buffer, dfa: Dfa) -> None:
         "static inline void dfa_match(const char *s, struct DfaMatch *match) {"
     )
     buf.unindented("#endif")
+
+
+def generate_c_match(buf: Buffer, dfa: Dfa, binary: bool = False) -> None:
+    loops = find_self_loops(
+        [data for _, data in dfa.iter_states()], C_SELF_LOOP_MIN_SIZE
+    )
+    for state, loop in loops.items():
+        generate_c_skip_table(buf, state, loop)
+        buf.skip()
+
+    names = dfa.get_tags()
+    generate_c_signature(buf)
     with buf.indent():
         buf.line("unsigned char c;")
         buf.skip()
@@ -174,60 +222,346 @@ def generate_c_match(buf: Buffer, dfa: Dfa) -> None:
         for state, data in dfa.iter_states():
             buf.unindented("S{}:", state)
             if data.entry_tag is not None:
-                buf.line(c_tag_action(data.entry_tag, False))
+                buf.line(c_tag_action(names[data.entry_tag], False))
             first, *rest = data.transitions
-            generate_c_eof_transition(buf, first, data)
-            generate_c_transitions(buf, rest)
+            if generate_c_eof_transition(buf, first, data, names):
+                rest = data.transitions
+            if state in loops:
+                generate_c_skip(buf, state, loops[state], names)
+            if binary:
+                generate_c_tree(buf, rest, names)
+            else:
+                generate_c_transitions(buf, rest, names)
     buf.line("}")
 
 
-def generate_c_eof_transition(
-        buf: Buffer, first: DfaTransition, data: DfaState) -> None:
+def generate_c_skip_table(buf: Buffer, state: int, loop: DfaSelfLoop) -> None:
+    skip = [0] * CHARSET_END
+    for start, end in loop.ranges:
+        skip[max(start, 1):end] = [1] * (end - max(start, 1))
+    c_table(buf, "dfa_skip_{}".format(state), skip)
+
+
+def generate_c_skip(buf: Buffer, state: int, loop: DfaSelfLoop,
+                    names: List[str]) -> None:
+    table = "dfa_skip_{}".format(state)
+    buf.line("if ({}[c]) {{", table)
+    with buf.indent():
+        buf.unindented("#ifdef DFA_USE_LIMIT")
+        buf.line(
+            "while (s != limit && {}[(unsigned char)*s]) {{ ++s; }}", table
+        )
+        buf.unindented("#else")
+        buf.line("while ({}[(unsigned char)*s]) {{ ++s; }}", table)
+        buf.unindented("#endif")
+        buf.line(c_transition(state, loop.tag, loop.at_exit, names))
+    buf.line("}")
+
+
+def generate_c_eof_transition(buf: Buffer, first: DfaTransition,
+                              data: DfaState, names: List[str]) -> bool:
     end, target, tag, at_exit = first
-    first_transition = c_transition_condition(end, target, tag, at_exit)
     handles_null = target is None and tag == data.eof_tag
     buf.unindented("#ifdef DFA_USE_LIMIT")
     buf.line(
-        "if (s == limit) {{ {} }}", c_transition(None, data.eof_tag, False)
+        "if (s == limit) {{ {} }}",
+        c_transition(None, data.eof_tag, False, names)
     )
     if not handles_null:
         buf.line("c = *(s++);")
         if end == 1:
-            buf.line(first_transition)
+            buf.line(c_transition_condition(end, target, tag, at_exit, names))
         buf.unindented("#else")
         buf.line("c = *(s++);")
         buf.line(
-            "if (c == 0) {{ {} }}", c_transition(None, data.eof_tag, True)
+            "if (c == 0) {{ {} }}",
+            c_transition(None, data.eof_tag, True, names)
         )
     buf.unindented("#endif")
     if handles_null:
         buf.line("c = *(s++);")
-    if handles_null or end != 1:
-        buf.line(first_transition)
+    return handles_null or end != 1
 
 
-def generate_c_transitions(buf: Buffer, transitions: DfaTransitions) -> None:
+def generate_c_transitions(buf: Buffer, transitions: DfaTransitions,
+                           names: List[str]) -> None:
     for end, target, tag, at_exit in transitions:
-        buf.line(c_transition_condition(end, target, tag, at_exit))
+        buf.line(c_transition_condition(end, target, tag, at_exit, names))
+
+
+def generate_c_tree(buf: Buffer, transitions: DfaTransitions,
+                    names: List[str]) -> None:
+    if len(transitions) <= BINARY_LEAF_SIZE:
+        *rest, (_, target, tag, at_exit) = transitions
+        generate_c_transitions(buf, rest, names)
+        buf.line(c_transition(target, tag, at_exit, names))
+        return
+    middle = len(transitions) // 2
+    buf.line("if (c < {}) {{", transitions[middle - 1].end)
+    with buf.indent():
+        generate_c_tree(buf, transitions[:middle], names)
+    buf.line("}")
+    generate_c_tree(buf, transitions[middle:], names)
+
+
+def c_int_type(low: int, high: int) -> str:
+    for bits in (8, 16, 32):
+        if low >= 0 and high < 1 << bits:
+            return "uint{}_t".format(bits)
+        if low >= -(1 << (bits - 1)) and high < 1 << (bits - 1):
+            return "int{}_t".format(bits)
+    return "int64_t"
+
+
+def c_table(buf: Buffer, name: str, values: List[int]) -> None:
+    buf.line(
+        "static const {} {}[{}] = {{",
+        c_int_type(min(values), max(values)), name, len(values)
+    )
+    with buf.indent():
+        for start in range(0, len(values), TABLE_ROW_SIZE):
+            row = values[start:start + TABLE_ROW_SIZE]
+            buf.line("{},", ", ".join(str(value) for value in row))
+    buf.line("};")
+
+
+def generate_c_table_match(buf: Buffer, dfa: Dfa) -> None:
+    classes = dfa.get_byte_classes()
+    class_count = max(classes) + 1
+    states = [data for _, data in dfa.iter_states()]
+
+    targets: List[int] = []
+    actions: List[int] = []
+    for row in dfa.get_class_table():
+        for target, tag, at_exit in row:
+            if target is not None and states[target].entry_tag is not None:
+                tag, at_exit = states[target].entry_tag, False
+            targets.append(-1 if target is None else target * class_count)
+            actions.append(0 if tag is None else (tag + 1) << 1 | at_exit)
+    eof_tokens = [
+        0 if data.eof_tag is None else data.eof_tag + 1 for data in states
+    ]
+    null_eof = [int(c_null_is_eof(data)) for data in states]
+
+    buf.line("#define DFA_CLASS_COUNT {}", class_count)
+    buf.skip()
+    c_table(buf, "dfa_classes", classes)
+    buf.skip()
+    c_table(buf, "dfa_targets", targets)
+    buf.skip()
+    c_table(buf, "dfa_actions", actions)
+    buf.skip()
+    c_table(buf, "dfa_eof_tokens", eof_tokens)
+    buf.skip()
+    if not all(null_eof):
+        c_table(buf, "dfa_null_eof", null_eof)
+        buf.skip()
+
+    entry_tag = states[0].entry_tag
+    generate_c_signature(buf)
+    with buf.indent():
+        buf.line("unsigned int state = 0;")
+        buf.line("unsigned int index;")
+        buf.line("unsigned int action;")
+        buf.line("unsigned char c;")
+        buf.skip()
+        buf.line("match->begin = match->end = s;")
+        buf.line(
+            "match->token = {};",
+            "DFA_INVALID_TOKEN" if entry_tag is None
+            else c_token_name(dfa.get_tags()[entry_tag])
+        )
+        buf.skip()
+        buf.line("for (;;) {")
+        with buf.indent():
+            buf.unindented("#ifdef DFA_USE_LIMIT")
+            buf.line("if (s == limit) {{ {} }}", c_table_eof_action(False))
+            buf.line("c = *(s++);")
+            buf.unindented("#else")
+            buf.line("c = *(s++);")
+            buf.line(
+                "if ({}) {{ {} }}",
+                "c == 0" if all(null_eof)
+                else "c == 0 && dfa_null_eof[state / DFA_CLASS_COUNT]",
+                c_table_eof_action(True)
+            )
+            buf.unindented("#endif")
+            buf.line("index = state + dfa_classes[c];")
+            buf.line("action = dfa_actions[index];")
+            buf.line(
+                "if (action) { match->end = s - (action & 1);"
+                " match->token = action >> 1; }"
+            )
+            buf.line("if (dfa_targets[index] < 0) { return; }")
+            buf.line("state = dfa_targets[index];")
+        buf.line("}")
+    buf.line("}")
+
+
+def c_null_is_eof(data: DfaState) -> bool:
+    _, target, tag, at_exit = data.transitions[0]
+    return not (
+        target is None and tag is not None and tag == data.eof_tag and
+        not at_exit
+    )
+
+
+def c_table_eof_action(at_exit: bool) -> str:
+    return (
+        "action = dfa_eof_tokens[state / DFA_CLASS_COUNT];"
+        " if (action) {{ match->end = {}; match->token = action; }}"
+        " return;"
+    ).format("s - 1" if at_exit else "s")
 
 
 def c_transition_condition(
-        end: int, target: Optional[int], tag: Optional[str],
-        at_exit: bool) -> str:
-    transition = c_transition(target, tag, at_exit)
+        end: int, target: Optional[int], tag: Optional[int], at_exit: bool,
+        names: List[str]) -> str:
+    transition = c_transition(target, tag, at_exit, names)
     if end == CHARSET_END:
         return transition
     return "if (c < {}) {{ {} }}".format(end, transition)
 
 
-def c_tag_action(tag: str, at_exit: bool) -> str:
+def c_tag_action(name: str, at_exit: bool) -> str:
     pos = "s - 1" if at_exit else "s"
-    return "match->end = {}; match->token = {};".format(pos, c_token_name(tag))
+    return "match->end = {}; match->token = {};".format(
+        pos, c_token_name(name)
+    )
 
 
-def c_transition(
-        target: Optional[int], tag: Optional[str], at_exit: bool) -> str:
+def c_transition(target: Optional[int], tag: Optional[int], at_exit: bool,
+                 names: List[str]) -> str:
     transition = "return;" if target is None else "goto S{};".format(target)
     if tag is not None:
-        transition = "{} {}".format(c_tag_action(tag, at_exit), transition)
+        transition = "{} {}".format(
+            c_tag_action(names[tag], at_exit), transition
+        )
     return transition
+
+
+PYTHON_UNPACK = """
+def _unpack(format, data):
+    data = bytes.fromhex(data)
+    count = len(data) // struct.calcsize(format)
+    return struct.unpack(">{}{}".format(count, format), data)
+
+"""
+
+PYTHON_RUNTIME = """
+def _expand(table):
+    result = []
+    for base in range(0, len(table), CLASS_COUNT):
+        row = table[base:base + CLASS_COUNT]
+        result.extend([row[c] for c in CLASSES])
+    return result
+
+
+_targets = [-1 if t < 0 else t << 8 for t in _expand(TARGETS)]
+_tags = [None if t < 0 else t for t in _expand(TAGS)]
+_deltas = _expand(DELTAS)
+_eof_tags = [None if t < 0 else t for t in EOF_TAGS]
+
+
+def _scan(view, start):
+    targets = _targets
+    tags = _tags
+    tag = None
+    end = start
+    state = 0
+    for pos, code in enumerate(view[start:], start):
+        index = state + code
+        new_tag = tags[index]
+        if new_tag is not None:
+            tag = new_tag
+            end = pos + _deltas[index]
+        state = targets[index]
+        if state < 0:
+            break
+    else:
+        eof_tag = _eof_tags[state >> 8]
+        if eof_tag is not None:
+            tag = eof_tag
+            end = len(view)
+    return tag, end
+
+
+def scan_once(input, start=0):
+    with memoryview(input) as view:
+        tag, end = _scan(view, start)
+    if tag is None:
+        return None
+    return TOKENS[tag], end
+
+
+def scan_spans(input, start=0):
+    with memoryview(input) as view:
+        size = len(view)
+        while start < size:
+            tag, end = _scan(view, start)
+            if tag is None:
+                raise ValueError("Input not recognized")
+            yield TOKENS[tag], start, end
+            start = end
+
+
+def scan_all(input):
+    for tag, start, end in scan_spans(input):
+        yield tag, bytes(input[start:end])
+"""
+
+
+def py_table(buf: Buffer, name: str, format: str,
+             values: Iterable[int]) -> None:
+    data = b"".join(struct.pack(">" + format, value) for value in values)
+    buf.line('{} = _unpack("{}", (', name, format)
+    with buf.indent():
+        for line in textwrap.wrap(data.hex(), 72):
+            buf.line('"{}"', line)
+    buf.line("))")
+
+
+def generate_python(dfa: Dfa) -> str:
+    dfa = with_dead_state(dfa)
+    table = dfa.get_table()
+    classes = dfa.get_byte_classes()
+    class_count = max(classes) + 1
+    representatives = [classes.index(c) for c in range(class_count)]
+    states = len(table.eof_tags)
+
+    targets: List[int] = []
+    tags: List[int] = []
+    deltas: List[int] = []
+    for base in range(0, states * CHARSET_END, CHARSET_END):
+        for code in representatives:
+            target = table.targets[base + code]
+            tag = table.tags[base + code]
+            targets.append(-1 if target < 0 else target // CHARSET_END)
+            tags.append(-1 if tag is None else tag)
+            deltas.append(table.deltas[base + code])
+
+    buf = Buffer(4)
+    buf.line("# Generated by derivatives, do not edit.")
+    buf.skip()
+    buf.line("import struct")
+    buf.skip()
+    buf.line("TOKENS = (")
+    with buf.indent():
+        for name in dfa.get_tags():
+            buf.line("{!r},", name)
+    buf.line(")")
+    buf.skip()
+    buf.line("CLASS_COUNT = {}", class_count)
+    buf.skip()
+    buf.unindented(PYTHON_UNPACK)
+    py_table(buf, "CLASSES", "B", classes)
+    int_format = "h" if max(states, len(dfa.get_tags())) < 0x8000 else "i"
+    py_table(buf, "TARGETS", int_format, targets)
+    py_table(buf, "TAGS", int_format, tags)
+    py_table(buf, "DELTAS", "B", deltas)
+    py_table(
+        buf, "EOF_TAGS", int_format,
+        (-1 if tag is None else tag for tag in table.eof_tags)
+    )
+    buf.unindented(PYTHON_RUNTIME)
+    return buf.getvalue().rstrip("\n") + "\n"
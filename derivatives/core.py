@@ -1,10 +1,22 @@
-from typing import Any, List, Set, Tuple
-
-from .partition import CHARSET_END, Partition, make_merge_copy_fn
+from functools import lru_cache
+from hashlib import sha256
+from itertools import count
+from typing import (
+    Any, Dict, FrozenSet, Iterator, List, Optional, Tuple, Type, TypeVar,
+    cast
+)
+from weakref import WeakValueDictionary
+
+from .partition import (
+    MERGE_ALL_MIN_SIZE, Partition, make_merge_copy_fn, merge_all,
+    merge_partitions
+)
 
 Ranges = Partition[bool]
 Derivatives = Partition["CRegex"]
 
+BALANCED_FOLD_MIN_SIZE = 8
+
 
 def merge_args(left: List["CRegex"], right: List["CRegex"]) -> List["CRegex"]:
     result: List[CRegex] = []
@@ -13,7 +25,7 @@ def merge_args(left: List["CRegex"], right: List["CRegex"]) -> List["CRegex"]:
     lval = next(lit, None)
     rval = next(rit, None)
     while lval is not None and rval is not None:
-        if lval == rval:
+        if lval is rval:
             result.append(lval)
             lval = next(lit, None)
             rval = next(rit, None)
@@ -44,21 +56,63 @@ KIND_INVERT = 8
 KIND_TAG = 9
 
 
-class CRegex:
+R = TypeVar("R", bound="CRegex")
+
+_interned: "WeakValueDictionary[Tuple[Any, ...], CRegex]" = \
+    WeakValueDictionary()
+_ids: Iterator[int] = count()
+
+
+class _Interned(type):
+
+    def __call__(cls: Type[Any], *args: Any) -> Any:
+        key = (cls._kind, *cls._make_key(*args))
+        regex = _interned.get(key)
+        if regex is None:
+            regex = cast(CRegex, super().__call__(*args))
+            regex._id = next(_ids)
+            regex._hash = hash(key)
+            _interned[key] = regex
+        return regex
+
+
+def interned_count() -> int:
+    return len(_interned)
+
+
+def interned_nodes() -> Iterator["CRegex"]:
+    yield from _interned.values()
+
+
+class CRegex(metaclass=_Interned):
+
+    __slots__ = ("_id", "_hash", "_nullable", "__weakref__")
 
     _kind: int
+    _id: int
+    _hash: int
+    _nullable: bool
 
-    def __init__(self, key: Tuple[Any, ...]):
-        self._key = (self._kind, *key)
-        self._hash = hash(self._key)
+    @staticmethod
+    def _make_key(*args: Any) -> Tuple[Any, ...]:
+        return args
 
     def nullable(self) -> bool:
-        raise NotImplementedError()
+        return self._nullable
 
     def derivatives(self) -> Derivatives:
+        return cached_derivatives(self)
+
+    def tags(self) -> FrozenSet[int]:
+        return cached_tags(self)
+
+    def _args(self) -> Tuple[Any, ...]:
+        return ()
+
+    def _derivatives(self) -> Derivatives:
         raise NotImplementedError()
 
-    def tags(self) -> Set[int]:
+    def _tags(self) -> FrozenSet[int]:
         raise NotImplementedError()
 
     def join(self, other: "CRegex") -> "CRegex":
@@ -68,7 +122,7 @@ class CRegex:
         return UnionCharClass(other, self)
 
     def _union_one(self, other: "CRegex") -> "CRegex":
-        if self == other:
+        if self is other:
             return self
         if self < other:
             return Union([self, other])
@@ -81,7 +135,7 @@ class CRegex:
         return other._union_one(self)
 
     def _intersect_one(self, other: "CRegex") -> "CRegex":
-        if self == other:
+        if self is other:
             return self
         if self < other:
             return Intersect([self, other])
@@ -99,37 +153,52 @@ class CRegex:
     def repeat(self) -> "CRegex":
         return Repeat(self)
 
-    def __eq__(self, other: object) -> bool:
-        if self is other:
-            return True
-        if isinstance(other, CRegex):
-            return self._key == other._key
-        return NotImplemented
-
     def __lt__(self, other: object) -> bool:
         if isinstance(other, CRegex):
-            return self._key < other._key
+            return self._id < other._id
         return NotImplemented
 
     def __hash__(self) -> int:
         return self._hash
 
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return type(self), self._args()
 
-class Empty(CRegex):
 
-    _kind = KIND_EMPTY
+def _sorted_items(cls: Type[R], items: List[CRegex]) -> R:
+    return cls(sorted(items))  # type: ignore
 
-    def __init__(self) -> None:
-        super().__init__(())
 
-    def nullable(self) -> bool:
-        return False
+CACHE_SIZE = 1 << 16
 
-    def derivatives(self) -> Derivatives:
-        return [(CHARSET_END, self)]
 
-    def tags(self) -> Set[int]:
-        return set()
+@lru_cache(maxsize=CACHE_SIZE)
+def cached_derivatives(regex: CRegex) -> Derivatives:
+    return regex._derivatives()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def cached_tags(regex: CRegex) -> FrozenSet[int]:
+    return regex._tags()
+
+
+def clear_caches() -> None:
+    cached_derivatives.cache_clear()
+    cached_tags.cache_clear()
+
+
+class Empty(CRegex):
+
+    __slots__ = ()
+
+    _kind = KIND_EMPTY
+    _nullable = False
+
+    def _derivatives(self) -> Derivatives:
+        return Partition.single(self)
+
+    def _tags(self) -> FrozenSet[int]:
+        return frozenset()
 
     def join(self, other: CRegex) -> CRegex:
         return self
@@ -164,19 +233,16 @@ EMPTY = Empty()
 
 class Epsilon(CRegex):
 
-    _kind = KIND_EPSILON
-
-    def __init__(self) -> None:
-        super().__init__(())
+    __slots__ = ()
 
-    def nullable(self) -> bool:
-        return True
+    _kind = KIND_EPSILON
+    _nullable = True
 
-    def derivatives(self) -> Derivatives:
-        return [(CHARSET_END, EMPTY)]
+    def _derivatives(self) -> Derivatives:
+        return Partition.single(EMPTY)
 
-    def tags(self) -> Set[int]:
-        return set()
+    def _tags(self) -> FrozenSet[int]:
+        return frozenset()
 
     def join(self, other: CRegex) -> CRegex:
         return other
@@ -188,25 +254,41 @@ class Epsilon(CRegex):
 EPSILON = Epsilon()
 
 
-union_ranges = make_merge_copy_fn(bool.__or__)
+def union_ranges(left: Ranges, right: Ranges) -> Ranges:
+    if len(left) == 1:
+        return left if left.values[0] else right
+    if len(right) == 1:
+        return right if right.values[0] else left
+    return merge_partitions(
+        left, right, bool.__or__, bool.__or__
+    ).coalesce()
 
 
 class CharClass(CRegex):
 
+    __slots__ = ("_ranges",)
+
     _kind = KIND_CHAR_CLASS
+    _nullable = False
 
     def __init__(self, ranges: Ranges):
         self._ranges = ranges
-        super().__init__(tuple(ranges))
 
-    def nullable(self) -> bool:
-        return False
+    @staticmethod
+    def _make_key(ranges: Ranges) -> Tuple[Any, ...]:
+        return (ranges.key(),)
 
-    def derivatives(self) -> Derivatives:
-        return [(end, EPSILON if pos else EMPTY) for end, pos in self._ranges]
+    def _args(self) -> Tuple[Any, ...]:
+        return (self._ranges,)
+
+    def _derivatives(self) -> Derivatives:
+        return Partition(
+            self._ranges.ends,
+            [EPSILON if pos else EMPTY for pos in self._ranges.values]
+        )
 
-    def tags(self) -> Set[int]:
-        return set()
+    def _tags(self) -> FrozenSet[int]:
+        return frozenset()
 
     def _union_char_class(self, other: Ranges) -> CRegex:
         return CharClass(union_ranges(self._ranges, other))
@@ -225,34 +307,54 @@ def union_regexes_items(left: CRegex, right: CRegex) -> CRegex:
     return left.union(right)
 
 
-union_regexes = make_merge_copy_fn(union_regexes_items)
+def union_regexes(left: Derivatives, right: Derivatives) -> Derivatives:
+    if len(right) == 1 and right.values[0] is EMPTY:
+        return left
+    if len(left) == 1 and left.values[0] is EMPTY:
+        return right
+    return merge_partitions(
+        left, right, union_regexes_items, union_regexes_items
+    )
+
+
+def union_all(regexes: List[CRegex]) -> CRegex:
+    if len(regexes) >= BALANCED_FOLD_MIN_SIZE:
+        middle = len(regexes) // 2
+        return union_all(regexes[:middle]).union(union_all(regexes[middle:]))
+    result: CRegex = EMPTY
+    for regex in regexes:
+        result = result.union(regex)
+    return result
 
 
 class Sequence(CRegex):
 
+    __slots__ = ("_first", "_second")
+
     _kind = KIND_SEQUENCE
 
     def __init__(self, first: CRegex, second: CRegex):
         self._first = first
         self._second = second
-        super().__init__((first, second))
+        self._nullable = first.nullable() and second.nullable()
 
-    def nullable(self) -> bool:
-        return self._first.nullable() and self._second.nullable()
+    def _args(self) -> Tuple[Any, ...]:
+        return (self._first, self._second)
 
-    def derivatives(self) -> Derivatives:
-        result = [
-            (end, item.join(self._second))
-            for end, item in self._first.derivatives()
-        ]
+    def _derivatives(self) -> Derivatives:
+        first = self._first.derivatives()
+        second = self._second
+        result = Partition(
+            first.ends, [item.join(second) for item in first.values]
+        )
         if self._first.nullable():
             result = union_regexes(result, self._second.derivatives())
         return result
 
-    def tags(self) -> Set[int]:
+    def _tags(self) -> FrozenSet[int]:
         tags = self._first.tags()
         if self._first.nullable():
-            tags.update(self._second.tags())
+            tags |= self._second.tags()
         return tags
 
     def join(self, other: CRegex) -> CRegex:
@@ -261,28 +363,40 @@ class Sequence(CRegex):
 
 class Union(CRegex):
 
+    __slots__ = ("_items",)
+
     _kind = KIND_UNION
 
     def __init__(self, items: List[CRegex]):
         self._items = items
-        super().__init__(tuple(items))
-
-    def nullable(self) -> bool:
-        return any(item.nullable() for item in self._items)
-
-    def derivatives(self) -> Derivatives:
-        items = iter(self._items)
-        result = next(items).derivatives()
-        for item in items:
-            result = union_regexes(result, item.derivatives())
-        return result
-
-    def tags(self) -> Set[int]:
-        items = iter(self._items)
-        tags = next(items).tags()
-        for item in items:
-            tags.update(item.tags())
-        return tags
+        self._nullable = any(item.nullable() for item in items)
+
+    @staticmethod
+    def _make_key(items: List[CRegex]) -> Tuple[Any, ...]:
+        return (tuple(items),)
+
+    def _args(self) -> Tuple[Any, ...]:
+        return (self._items,)
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return _sorted_items, (type(self), self._items)
+
+    def _derivatives(self) -> Derivatives:
+        if len(self._items) < MERGE_ALL_MIN_SIZE:
+            items = iter(self._items)
+            result = next(items).derivatives()
+            for item in items:
+                result = union_regexes(result, item.derivatives())
+            return result
+        merged = merge_all(
+            [item.derivatives() for item in self._items], EMPTY
+        )
+        return Partition(
+            merged.ends, [union_all(values) for values in merged.values]
+        )
+
+    def _tags(self) -> FrozenSet[int]:
+        return frozenset().union(*(item.tags() for item in self._items))
 
     def _union_char_class(self, other: Ranges) -> CRegex:
         return UnionCharClass(other, self)
@@ -306,20 +420,30 @@ union_regex_ranges = make_merge_copy_fn(union_regex_ranges_item)
 
 class UnionCharClass(CRegex):
 
+    __slots__ = ("_ranges", "_regex")
+
     _kind = KIND_UNION_CHAR_CLASS
 
     def __init__(self, ranges: Ranges, regex: CRegex):
         self._ranges = ranges
         self._regex = regex
-        super().__init__((tuple(ranges), regex))
+        self._nullable = regex.nullable()
 
-    def nullable(self) -> bool:
-        return self._regex.nullable()
+    @staticmethod
+    def _make_key(ranges: Ranges,
+                  regex: CRegex) -> Tuple[Any, ...]:
+        return (ranges.key(), regex)
 
-    def derivatives(self) -> Derivatives:
-        return union_regex_ranges(self._regex.derivatives(), self._ranges)
+    def _args(self) -> Tuple[Any, ...]:
+        return (self._ranges, self._regex)
 
-    def tags(self) -> Set[int]:
+    def _derivatives(self) -> Derivatives:
+        derivatives = self._regex.derivatives()
+        if len(self._ranges) == 1 and not self._ranges.values[0]:
+            return derivatives
+        return union_regex_ranges(derivatives, self._ranges)
+
+    def _tags(self) -> FrozenSet[int]:
         return self._regex.tags()
 
     def _union_char_class(self, other: Ranges) -> CRegex:
@@ -343,29 +467,56 @@ def intersect_regexes_item(left: CRegex, right: CRegex) -> CRegex:
 intersect_regexes = make_merge_copy_fn(intersect_regexes_item)
 
 
+def intersect_all(regexes: List[CRegex], count: int) -> CRegex:
+    if len(regexes) < count:
+        return EMPTY
+    result = regexes[0]
+    for regex in regexes[1:]:
+        result = result.intersect(regex)
+    return result
+
+
 class Intersect(CRegex):
 
+    __slots__ = ("_items",)
+
     _kind = KIND_INTERSECT
 
     def __init__(self, items: List[CRegex]):
         self._items = items
-        super().__init__(tuple(items))
-
-    def nullable(self) -> bool:
-        return all(item.nullable() for item in self._items)
-
-    def derivatives(self) -> Derivatives:
-        items = iter(self._items)
-        result = next(items).derivatives()
-        for item in items:
-            result = intersect_regexes(result, item.derivatives())
-        return result
-
-    def tags(self) -> Set[int]:
+        self._nullable = all(item.nullable() for item in items)
+
+    @staticmethod
+    def _make_key(items: List[CRegex]) -> Tuple[Any, ...]:
+        return (tuple(items),)
+
+    def _args(self) -> Tuple[Any, ...]:
+        return (self._items,)
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return _sorted_items, (type(self), self._items)
+
+    def _derivatives(self) -> Derivatives:
+        if len(self._items) < MERGE_ALL_MIN_SIZE:
+            items = iter(self._items)
+            result = next(items).derivatives()
+            for item in items:
+                result = intersect_regexes(result, item.derivatives())
+            return result
+        merged = merge_all(
+            [item.derivatives() for item in self._items], EMPTY
+        )
+        count = len(self._items)
+        return Partition(
+            merged.ends,
+            [intersect_all(values, count) for values in merged.values]
+        )
+
+    def _tags(self) -> FrozenSet[int]:
         items = iter(self._items)
         tags = next(items).tags()
         for item in items:
-            tags.intersection_update(item.tags())
+            tags &= item.tags()
         return tags
 
     def _intersect_one(self, other: CRegex) -> CRegex:
@@ -380,21 +531,24 @@ class Intersect(CRegex):
 
 class Repeat(CRegex):
 
+    __slots__ = ("_regex",)
+
     _kind = KIND_REPEAT
+    _nullable = True
 
     def __init__(self, regex: CRegex):
         self._regex = regex
-        super().__init__((regex,))
 
-    def nullable(self) -> bool:
-        return True
+    def _args(self) -> Tuple[Any, ...]:
+        return (self._regex,)
 
-    def derivatives(self) -> Derivatives:
-        return [
-            (end, item.join(self)) for end, item in self._regex.derivatives()
-        ]
+    def _derivatives(self) -> Derivatives:
+        derivatives = self._regex.derivatives()
+        return Partition(
+            derivatives.ends, [item.join(self) for item in derivatives.values]
+        )
 
-    def tags(self) -> Set[int]:
+    def _tags(self) -> FrozenSet[int]:
         return self._regex.tags()
 
     def repeat(self) -> CRegex:
@@ -403,22 +557,25 @@ class Repeat(CRegex):
 
 class Invert(CRegex):
 
+    __slots__ = ("_regex",)
+
     _kind = KIND_INVERT
 
     def __init__(self, regex: CRegex):
         self._regex = regex
-        super().__init__((regex,))
+        self._nullable = not regex.nullable()
 
-    def nullable(self) -> bool:
-        return not self._regex.nullable()
+    def _args(self) -> Tuple[Any, ...]:
+        return (self._regex,)
 
-    def derivatives(self) -> Derivatives:
-        return [
-            (end, item.invert()) for end, item in self._regex.derivatives()
-        ]
+    def _derivatives(self) -> Derivatives:
+        derivatives = self._regex.derivatives()
+        return Partition(
+            derivatives.ends, [item.invert() for item in derivatives.values]
+        )
 
-    def tags(self) -> Set[int]:
-        return set()
+    def _tags(self) -> FrozenSet[int]:
+        return frozenset()
 
     def invert(self) -> CRegex:
         return self._regex
@@ -426,17 +583,62 @@ class Invert(CRegex):
 
 class Tag(CRegex):
 
+    __slots__ = ("_tag",)
+
     _kind = KIND_TAG
+    _nullable = True
 
     def __init__(self, tag: int):
         self._tag = tag
-        super().__init__((tag,))
-
-    def nullable(self) -> bool:
-        return True
 
-    def derivatives(self) -> Derivatives:
-        return [(CHARSET_END, EMPTY)]
-
-    def tags(self) -> Set[int]:
-        return {self._tag}
+    def _args(self) -> Tuple[Any, ...]:
+        return (self._tag,)
+
+    def _derivatives(self) -> Derivatives:
+        return Partition.single(EMPTY)
+
+    def _tags(self) -> FrozenSet[int]:
+        return frozenset((self._tag,))
+
+
+def _iter_children(args: Tuple[Any, ...]) -> Iterator[CRegex]:
+    for arg in args:
+        if isinstance(arg, CRegex):
+            yield arg
+        elif isinstance(arg, list):
+            yield from (item for item in arg if isinstance(item, CRegex))
+
+
+def _encode(value: Any, memo: Dict[CRegex, bytes]) -> Any:
+    if isinstance(value, CRegex):
+        return memo[value]
+    if isinstance(value, Partition):
+        return tuple(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_encode(item, memo) for item in value)
+    return value
+
+
+def fingerprint(regex: CRegex,
+                memo: Optional[Dict[CRegex, bytes]] = None) -> bytes:
+    if memo is None:
+        memo = {}
+    stack = [regex]
+    while stack:
+        node = stack[-1]
+        if node in memo:
+            stack.pop()
+            continue
+        args = node._args()
+        children = [
+            child for child in _iter_children(args) if child not in memo
+        ]
+        if children:
+            stack.extend(children)
+            continue
+        stack.pop()
+        parts = _encode(args, memo)
+        if node._kind in (KIND_UNION, KIND_INTERSECT):
+            parts = (tuple(sorted(parts[0])),)
+        memo[node] = sha256(repr((node._kind, parts)).encode()).digest()
+    return memo[regex]
@@ -1,94 +1,571 @@
-from collections import deque
-from itertools import groupby
+import os
+import re
+import time
+from array import array
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, groupby
+from mmap import ACCESS_READ, mmap
+from operator import itemgetter
 from typing import (
-    Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+    Any, BinaryIO, Callable, Deque, Dict, Iterable, Iterator, List,
+    NamedTuple, Optional, Pattern, Tuple, Union, cast
 )
 
+from .core import cached_derivatives, interned_count
+from .partition import CHARSET_END
 from .vector import Vector
 
 
 class DfaTransition(NamedTuple):
     end: int
     target: Optional[int]
-    tag: Optional[str]
+    tag: Optional[int]
     at_exit: bool
 
 
 DfaTransitions = List[DfaTransition]
+Input = Union[bytes, bytearray, memoryview, mmap]
+Source = Union[BinaryIO, Iterable[bytes]]
+Path = Union[str, "os.PathLike[str]"]
+
+CHUNK_SIZE = 1 << 16
+
+COLUMN_BATCH_SIZE = 1 << 16
+
+SELF_LOOP_MIN_SIZE = 100
 
 
 class DfaState(NamedTuple):
-    entry_tag: Optional[str]
-    eof_tag: Optional[str]
+    entry_tag: Optional[int]
+    eof_tag: Optional[int]
     transitions: DfaTransitions
 
 
-class Dfa:
-    def __init__(self, states: List[DfaState], tags: List[str]):
+class DfaClassTransition(NamedTuple):
+    target: Optional[int]
+    tag: Optional[int]
+    at_exit: bool
+
+
+DfaClassTable = List[List[DfaClassTransition]]
+
+
+class DfaSelfLoop(NamedTuple):
+    ranges: List[Tuple[int, int]]
+    tag: Optional[int]
+    at_exit: bool
+
+
+class DfaTableColumns(NamedTuple):
+    classes: List[int]
+    targets: List[int]
+    tags: List[Optional[int]]
+    deltas: List[int]
+    eof_tags: List[Optional[int]]
+
+
+def make_table_columns(dfa: "Dfa") -> DfaTableColumns:
+    columns = DfaTableColumns(dfa.get_byte_classes(), [], [], [], [])
+    for (_, (entry, eof_tag, _)), row in zip(
+            dfa.iter_states(), dfa.get_class_table()):
+        for target, tag, at_exit in row:
+            columns.targets.append(
+                -1 if target is None else target * CHARSET_END
+            )
+            if tag is None:
+                columns.tags.append(entry)
+                columns.deltas.append(0)
+            else:
+                columns.tags.append(tag)
+                columns.deltas.append(0 if at_exit else 1)
+        columns.eof_tags.append(entry if eof_tag is None else eof_tag)
+    return columns
+
+
+class DfaTable:
+    def __init__(self, dfa: "Dfa"):
+        columns = dfa.get_table_columns()
+        self.targets: List[int] = []
+        self.tags: List[Optional[int]] = []
+        self.deltas: List[int] = []
+        self.eof_tags = columns.eof_tags
+        if columns.classes:
+            expand = itemgetter(*columns.classes)
+            width = max(columns.classes) + 1
+            for start in range(0, len(columns.targets), width):
+                stop = start + width
+                self.targets.extend(expand(columns.targets[start:stop]))
+                self.tags.extend(expand(columns.tags[start:stop]))
+                self.deltas.extend(expand(columns.deltas[start:stop]))
+
+        self.loops: Dict[int, Pattern[bytes]] = {}
+        self.loop_targets = list(self.targets)
+        for state, loop in dfa.get_self_loops().items():
+            base = state * CHARSET_END
+            self.loops[base] = re.compile(b"[" + b"".join(
+                re.escape(bytes([start])) + b"-" + re.escape(bytes([end - 1]))
+                for start, end in loop.ranges
+            ) + b"]*")
+            for start, end in loop.ranges:
+                for code in range(start, end):
+                    self.loop_targets[base + code] = -2 - base
+
+    def advance(
+            self, input: memoryview, start: int, state: int,
+            tag: Optional[int], end: int
+    ) -> Tuple[int, Optional[int], int, int]:
+        targets = self.loop_targets
+        tags = self.tags
+        while True:
+            for pos, code in enumerate(input[start:], start):
+                index = state + code
+                new_tag = tags[index]
+                if new_tag is not None:
+                    tag = new_tag
+                    end = pos + self.deltas[index]
+                state = targets[index]
+                if state < 0:
+                    break
+            else:
+                return state, tag, end, len(input)
+            if state == -1:
+                return state, tag, end, pos + 1
+            state = -2 - state
+            match = self.loops[state].match(input, pos + 1)
+            # The loop pattern is a starred class, so it always matches.
+            assert match is not None
+            start = match.end()
+            if new_tag is not None:
+                end = start - 1 + self.deltas[index]
+
+    def finish(self, state: int, tag: Optional[int], end: int,
+               size: int) -> Tuple[Optional[int], int]:
+        eof_tag = self.eof_tags[state // CHARSET_END]
+        if eof_tag is None:
+            return tag, end
+        return eof_tag, size
+
+    def scan_once(self, input: memoryview,
+                  start: int = 0) -> Optional[Tuple[int, int]]:
+        tag, end, _ = self.scan_reach(input, start)
+        if tag is None:
+            return None
+        return tag, end
+
+    def scan_reach(self, input: memoryview,
+                   start: int = 0) -> Tuple[Optional[int], int, int]:
+        state, tag, end, stop = self.advance(input, start, 0, None, start)
+        if state >= 0:
+            tag, end = self.finish(state, tag, end, len(input))
+            stop += 1
+        return tag, end, stop
+
+
+class TokenColumns(NamedTuple):
+    ids: "array[int]"
+    starts: "array[int]"
+    ends: "array[int]"
+
+    def to_numpy(self) -> Tuple[Any, Any, Any]:
+        import numpy
+        return (
+            numpy.frombuffer(self.ids, dtype=numpy.uint32),
+            numpy.frombuffer(self.starts, dtype=numpy.int64),
+            numpy.frombuffer(self.ends, dtype=numpy.int64),
+        )
+
+
+def make_columns(ids: "array[int]", ends: "array[int]",
+                 start: int) -> TokenColumns:
+    starts = array("q")
+    if ends:
+        starts.append(start)
+        starts.extend(ends[:-1])
+    return TokenColumns(ids, starts, ends)
+
+
+class Scanner:
+    def get_tags(self) -> List[str]:
+        raise NotImplementedError()
+
+    def get_table(self) -> DfaTable:
+        raise NotImplementedError()
+
+    def scan_once(self, input: Input,
+                  start: int = 0) -> Optional[Tuple[str, int]]:
+        with memoryview(input) as view:
+            result = self.get_table().scan_once(view, start)
+        if result is None:
+            return None
+        tag, pos = result
+        return self.get_tags()[tag], pos
+
+    def scan_spans(self, input: Input,
+                   start: int = 0) -> Iterator[Tuple[str, int, int]]:
+        table = self.get_table()
+        names = self.get_tags()
+        with memoryview(input) as view:
+            end = len(view)
+            while start < end:
+                result = table.scan_once(view, start)
+                if result is None:
+                    raise ValueError("Input not recognized")
+                tag, pos = result
+                yield names[tag], start, pos
+                start = pos
+
+    def scan_all(self, input: Input) -> Iterator[Tuple[str, bytes]]:
+        for tag, start, end in self.scan_spans(input):
+            yield tag, bytes(input[start:end])
+
+    def scan_columns(self, input: Input, start: int = 0) -> TokenColumns:
+        with memoryview(input) as view:
+            return self._scan_columns(view, start, len(view))
+
+    def iter_columns(
+            self, input: Input, start: int = 0,
+            batch_size: int = COLUMN_BATCH_SIZE) -> Iterator[TokenColumns]:
+        with memoryview(input) as view:
+            while start < len(view):
+                columns = self._scan_columns(view, start, batch_size)
+                yield columns
+                start = columns.ends[-1]
+
+    def _scan_columns(self, view: memoryview, start: int,
+                      count: int) -> TokenColumns:
+        scan_once = self.get_table().scan_once
+        ids: List[int] = []
+        ends: List[int] = []
+        pos = start
+        size = len(view)
+        while pos < size and count:
+            result = scan_once(view, pos)
+            if result is None:
+                raise ValueError("Input not recognized")
+            tag, pos = result
+            ids.append(tag)
+            ends.append(pos)
+            count -= 1
+        return make_columns(array("I", ids), array("q", ends), start)
+
+    def scan_file(self, path: Path) -> Iterator[Tuple[str, int, int]]:
+        with open(path, "rb") as fp:
+            if os.fstat(fp.fileno()).st_size == 0:
+                return
+            with mmap(fp.fileno(), 0, access=ACCESS_READ) as mapping:
+                yield from self.scan_spans(mapping)
+
+    def scan_stream(
+            self, source: Source,
+            chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, bytes]]:
+        table = self.get_table()
+        names = self.get_tags()
+        buffer = bytearray()
+        start = pos = 0
+        state, tag, end = 0, None, 0
+        chunks = chain(iter_chunks(source, chunk_size), (None,))
+        for chunk in chunks:
+            del buffer[:start]
+            pos -= start
+            end -= start
+            start = 0
+            if chunk is not None:
+                buffer += chunk
+            with memoryview(buffer) as view:
+                size = len(view)
+                while start < size:
+                    state, tag, end, _ = table.advance(
+                        view, pos, state, tag, end
+                    )
+                    if state >= 0:
+                        if chunk is not None:
+                            pos = size
+                            break
+                        tag, end = table.finish(state, tag, end, size)
+                    if tag is None:
+                        raise ValueError("Input not recognized")
+                    yield names[tag], bytes(view[start:end])
+                    start = pos = end
+                    state, tag = 0, None
+
+
+class Dfa(Scanner):
+    def __init__(self, states: Optional[List[DfaState]], tags: List[str],
+                 load_states: Optional[Callable[[], List[DfaState]]] = None,
+                 columns: Optional[DfaTableColumns] = None,
+                 loops: Optional[Dict[int, DfaSelfLoop]] = None):
         self._states = states
+        self._load_states = load_states
         self._tags = tags
+        self._classes: Optional[Tuple[List[int], DfaClassTable]] = None
+        self._columns = columns
+        self._table: Optional[DfaTable] = None
+        self._loops = loops
+
+    def _get_states(self) -> List[DfaState]:
+        if self._states is None:
+            assert self._load_states is not None
+            self._states = self._load_states()
+            self._load_states = None
+        return self._states
 
     def iter_states(self) -> Iterator[Tuple[int, DfaState]]:
-        return enumerate(self._states)
+        return enumerate(self._get_states())
 
     def get_tags(self) -> List[str]:
         return self._tags
 
-    def scan_once(self, input: bytes) -> Optional[Tuple[str, int]]:
-        result: Optional[Tuple[str, int]] = None
-        state: int = 0
-        for pos, code in enumerate(input):
-            entry, _, transitions = self._states[state]
-            if entry is not None:
-                result = (entry, pos)
-            for end, target, tag, at_exit in transitions:
-                if code < end:
-                    if tag is not None:
-                        result = (tag, pos if at_exit else pos + 1)
-                    if target is None:
-                        return result
-                    state = target
-                    break
-        tag = self._states[state].eof_tag
-        if tag is not None:
-            result = (tag, len(input))
-        return result
-
-    def scan_all(self, input: bytes) -> Iterator[Tuple[str, bytes]]:
-        while input:
-            result = self.scan_once(input)
-            if result is None:
-                raise ValueError("Input not recognized")
-            tag, pos = result
-            yield tag, input[:pos]
-            input = input[pos:]
+    def get_byte_classes(self) -> List[int]:
+        if self._columns is not None:
+            return self._columns.classes
+        return self._get_class_data()[0]
+
+    def get_class_table(self) -> DfaClassTable:
+        return self._get_class_data()[1]
+
+    def _get_class_data(self) -> Tuple[List[int], DfaClassTable]:
+        if self._classes is None:
+            self._classes = make_byte_classes(self._get_states())
+        return self._classes
+
+    def get_table_columns(self) -> DfaTableColumns:
+        if self._columns is None:
+            self._columns = make_table_columns(self)
+        return self._columns
+
+    def get_self_loops(self) -> Dict[int, DfaSelfLoop]:
+        if self._loops is None:
+            self._loops = find_self_loops(self._get_states())
+        return self._loops
+
+    def get_table(self) -> DfaTable:
+        if self._table is None:
+            self._table = DfaTable(self)
+        return self._table
+
+
+def make_byte_classes(
+        states: List[DfaState]) -> Tuple[List[int], DfaClassTable]:
+    ends = sorted({
+        transition.end for state in states for transition in state.transitions
+    })
+    columns: Dict[Tuple[DfaClassTransition, ...], int] = {}
+    classes: List[int] = []
+    positions = [0] * len(states)
+    last = 0
+    for end in ends:
+        column: List[DfaClassTransition] = []
+        for index, state in enumerate(states):
+            transition = state.transitions[positions[index]]
+            column.append(DfaClassTransition(*transition[1:]))
+            if transition.end == end:
+                positions[index] += 1
+        byte_class = columns.setdefault(tuple(column), len(columns))
+        classes.extend([byte_class] * (end - last))
+        last = end
+
+    table: DfaClassTable = [[] for _ in states]
+    for key in columns:
+        for row, cell in zip(table, key):
+            row.append(cell)
+    return classes, table
+
+
+def find_self_loops(
+        states: List[DfaState],
+        min_size: int = SELF_LOOP_MIN_SIZE) -> Dict[int, DfaSelfLoop]:
+    loops: Dict[int, DfaSelfLoop] = {}
+    for state, (_, _, transitions) in enumerate(states):
+        groups: Dict[
+            Tuple[Optional[int], bool], List[Tuple[int, int]]
+        ] = defaultdict(list)
+        last = 0
+        for end, target, tag, at_exit in transitions:
+            if target == state:
+                groups[(tag, at_exit)].append((last, end))
+            last = end
+        best = max(
+            groups.items(), default=None,
+            key=lambda item: sum(end - start for start, end in item[1])
+        )
+        if best is None:
+            continue
+        (tag, at_exit), ranges = best
+        if sum(end - start for start, end in ranges) >= min_size:
+            loops[state] = DfaSelfLoop(ranges, tag, at_exit)
+    return loops
+
+
+def iter_chunks(source: Source, chunk_size: int) -> Iterator[bytes]:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        raise TypeError("Expected a binary file or an iterable of chunks")
+    if hasattr(source, "read"):
+        read = cast(BinaryIO, source).read
+        chunk = read(chunk_size)
+        while chunk:
+            yield chunk
+            chunk = read(chunk_size)
+    else:
+        yield from source
+
+
+class DfaStats:
+    def __init__(self) -> None:
+        self.states_explored = 0
+        self.states_kept = 0
+        self.states_minimized: Optional[int] = None
+        self.derivative_calls = 0
+        self.derivative_hits = 0
+        self.transitions = 0
+        self.vector_hits = 0
+        self.peak_nodes = 0
+        self.max_vector_size = 0
+        self.cache_hit = False
+        self.timings: Dict[str, float] = {}
+
+    def derivative_hit_rate(self) -> float:
+        return self.derivative_hits / max(self.derivative_calls, 1)
+
+    def vector_hit_rate(self) -> float:
+        return self.vector_hits / max(self.transitions, 1)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "states_explored": self.states_explored,
+            "states_kept": self.states_kept,
+            "states_minimized": self.states_minimized,
+            "derivative_calls": self.derivative_calls,
+            "derivative_hit_rate": self.derivative_hit_rate(),
+            "transitions": self.transitions,
+            "vector_hit_rate": self.vector_hit_rate(),
+            "peak_nodes": self.peak_nodes,
+            "max_vector_size": self.max_vector_size,
+            "cache_hit": self.cache_hit,
+            "timings": dict(self.timings),
+        }
+
+    def __repr__(self) -> str:
+        return "DfaStats({})".format(", ".join(
+            "{}={!r}".format(key, value)
+            for key, value in self.as_dict().items()
+        ))
 
 
 class _State:
-    def __init__(self, tag: Optional[str] = None):
+    def __init__(self, tag: Optional[int] = None):
         self.index: Optional[int] = None
-        self.transitions: List[Tuple[int, _State, Optional[str]]] = []
+        self.transitions: List[Tuple[int, _State, Optional[int]]] = []
         self.incoming: List[_State] = []
         self.tag = tag
         self.live = False
 
 
-def make_dfa(vector: Vector, tag_resolver: Callable[[List[int]], str]) -> Dfa:
+VectorTransitions = Iterable[Tuple[int, Tuple[List[int], Vector]]]
+TransitionList = List[Tuple[int, Tuple[List[int], Vector]]]
+TransitionMemo = Dict[Vector, TransitionList]
+
+PARALLEL_MIN_BATCH = 16
+
+
+def vector_transitions(vector: Vector) -> TransitionList:
+    return list(vector.transitions())
+
+
+def counted_vector_transitions(
+        vector: Vector) -> Tuple[TransitionList, int, int]:
+    before = cached_derivatives.cache_info()
+    transitions = vector_transitions(vector)
+    after = cached_derivatives.cache_info()
+    return transitions, after.hits - before.hits, after.misses - before.misses
+
+
+def add_derivative_counts(
+        results: Iterable[Tuple[TransitionList, int, int]],
+        stats: Optional["DfaStats"]) -> Iterator[TransitionList]:
+    for transitions, hits, misses in results:
+        if stats is not None:
+            stats.derivative_hits += hits
+            stats.derivative_calls += hits + misses
+        yield transitions
+
+
+def explore(queue: Deque[Tuple[_State, Vector]], workers: Optional[int],
+            memo: Optional[TransitionMemo] = None,
+            stats: Optional["DfaStats"] = None
+            ) -> Iterator[Tuple[_State, VectorTransitions]]:
+    if workers is None:
+        while queue:
+            state, vector = queue.popleft()
+            if memo is None:
+                yield state, vector.transitions()
+                continue
+            transitions = memo.get(vector)
+            if transitions is None:
+                transitions = memo[vector] = vector_transitions(vector)
+            yield state, transitions
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        while queue:
+            batch = list(queue)
+            queue.clear()
+            vectors = [
+                vector for _, vector in batch
+                if memo is None or vector not in memo
+            ]
+            results: Iterable[TransitionList]
+            if len(vectors) < PARALLEL_MIN_BATCH:
+                results = map(vector_transitions, vectors)
+            else:
+                results = add_derivative_counts(executor.map(
+                    counted_vector_transitions, vectors,
+                    chunksize=max(1, len(vectors) // (4 * workers))
+                ), stats)
+            computed = iter(results)
+            for state, vector in batch:
+                if memo is None:
+                    yield state, next(computed)
+                    continue
+                transitions = memo.get(vector)
+                if transitions is None:
+                    transitions = memo[vector] = next(computed)
+                yield state, transitions
+
+
+def make_dfa(vector: Vector, tag_resolver: Callable[[List[int]], str],
+             minimize: bool = False, workers: Optional[int] = None,
+             stats: Optional[DfaStats] = None,
+             memo: Optional[TransitionMemo] = None,
+             names: Optional[List[str]] = None) -> Dfa:
+    if stats is not None:
+        derivatives_before = cached_derivatives.cache_info()
+        stats.derivative_hits = stats.derivative_calls = 0
+        stats.max_vector_size = max(stats.max_vector_size, len(vector))
+        stats.peak_nodes = max(stats.peak_nodes, interned_count())
+        last = time.perf_counter()
+
     state = _State()
     vector_to_index: Dict[Vector, int] = {vector: 0}
     states: List[_State] = [state]
-    tags: Set[str] = set()
+    tag_ids: Dict[str, int] = {}
+    for name in names or []:
+        tag_ids.setdefault(name, len(tag_ids))
+    resolved: Dict[Tuple[int, ...], int] = {}
     queue = deque([(state, vector)])
     live_queue: Deque[_State] = deque()
 
-    while queue:
-        source, source_vector = queue.popleft()
-
-        for end, (target_tags, target_vector) in source_vector.transitions():
-            target_tag: Optional[str] = None
+    for source, successors in explore(queue, workers, memo, stats):
+        for end, (target_tags, target_vector) in successors:
+            target_tag: Optional[int] = None
             if target_tags:
-                target_tag = tag_resolver(target_tags)
-                tags.add(target_tag)
+                key = tuple(target_tags)
+                target_tag = resolved.get(key)
+                if target_tag is None:
+                    target_tag = tag_ids.setdefault(
+                        tag_resolver(target_tags), len(tag_ids)
+                    )
+                    resolved[key] = target_tag
                 source.live = True
                 live_queue.append(source)
 
@@ -98,6 +575,10 @@ def make_dfa(vector: Vector, tag_resolver: Callable[[List[int]], str]) -> Dfa:
                 target = _State(target_tag)
                 states.append(target)
                 queue.append((target, target_vector))
+                if stats is not None:
+                    stats.max_vector_size = max(
+                        stats.max_vector_size, len(target_vector)
+                    )
             else:
                 target = states[target_index]
                 if target.tag != target_tag:
@@ -106,6 +587,15 @@ def make_dfa(vector: Vector, tag_resolver: Callable[[List[int]], str]) -> Dfa:
             source.transitions.append((end, target, target_tag))
             target.incoming.append(source)
 
+        if stats is not None:
+            stats.peak_nodes = max(stats.peak_nodes, interned_count())
+
+    if stats is not None:
+        stats.transitions = sum(len(state.transitions) for state in states)
+        stats.vector_hits = stats.transitions - len(states) + 1
+        stats.states_explored = len(states)
+        last = _lap(stats, "explore", last)
+
     while live_queue:
         target = live_queue.popleft()
         for source in target.incoming:
@@ -117,6 +607,10 @@ def make_dfa(vector: Vector, tag_resolver: Callable[[List[int]], str]) -> Dfa:
     for index, state in enumerate(states):
         state.index = index
 
+    if stats is not None:
+        stats.states_kept = len(states)
+        last = _lap(stats, "prune", last)
+
     dfa_states: List[DfaState] = []
     for state in states:
         lookahead = False
@@ -139,7 +633,67 @@ def make_dfa(vector: Vector, tag_resolver: Callable[[List[int]], str]) -> Dfa:
             )
         )
 
-    return Dfa(dfa_states, sorted(tags))
+    if stats is not None:
+        last = _lap(stats, "build", last)
+
+    if minimize:
+        dfa_states = minimize_states(dfa_states)
+        if stats is not None:
+            stats.states_minimized = len(dfa_states)
+            last = _lap(stats, "minimize", last)
+
+    if stats is not None:
+        derivatives_after = cached_derivatives.cache_info()
+        hits = derivatives_after.hits - derivatives_before.hits
+        stats.derivative_hits += hits
+        stats.derivative_calls += hits + \
+            derivatives_after.misses - derivatives_before.misses
+
+    return Dfa(dfa_states, list(tag_ids))
+
+
+def _lap(stats: DfaStats, phase: str, last: float) -> float:
+    now = time.perf_counter()
+    stats.timings[phase] = stats.timings.get(phase, 0.0) + now - last
+    return now
+
+
+def minimize_states(states: List[DfaState]) -> List[DfaState]:
+    blocks: Dict[Tuple[object, ...], int] = {}
+    partition = [
+        blocks.setdefault((state.entry_tag, state.eof_tag), len(blocks))
+        for state in states
+    ]
+    count = 0
+    while count != len(blocks):
+        count = len(blocks)
+        blocks = {}
+        partition = [
+            blocks.setdefault(
+                (block, *remap_transitions(state.transitions, partition)),
+                len(blocks)
+            )
+            for block, state in zip(partition, states)
+        ]
+
+    result: Dict[int, DfaState] = {}
+    for block, state in zip(partition, states):
+        if block not in result:
+            result[block] = DfaState(
+                state.entry_tag, state.eof_tag,
+                remap_transitions(state.transitions, partition)
+            )
+    return list(result.values())
+
+
+def remap_transitions(transitions: DfaTransitions,
+                      mapping: List[int]) -> DfaTransitions:
+    return compress_transitions([
+        DfaTransition(
+            end, None if target is None else mapping[target], tag, at_exit
+        )
+        for end, target, tag, at_exit in transitions
+    ])
 
 
 def compress_transitions(transitions: DfaTransitions) -> DfaTransitions:
@@ -5,6 +5,8 @@ from .utf8 import utf8_range_regex
 
 
 class Regex:
+    __slots__ = ("_regex",)
+
     def __init__(self, regex: CRegex):
         self._regex = regex
 
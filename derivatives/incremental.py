@@ -0,0 +1,70 @@
+from typing import Callable, List, NamedTuple
+
+from .dfa import Input, Scanner
+
+
+class Token(NamedTuple):
+    tag: str
+    start: int
+    end: int
+    reach: int
+
+
+def scan_tokens(scanner: Scanner, input: Input) -> List[Token]:
+    return _scan(scanner, input, 0, [], [], 0, 0)
+
+
+def relex(scanner: Scanner, tokens: List[Token], input: Input, offset: int,
+          deleted: int, inserted: bytes) -> List[Token]:
+    first = _search(tokens, lambda token: token.reach > offset)
+    if first < len(tokens):
+        start = tokens[first].start
+    else:
+        start = tokens[-1].end if tokens else 0
+    resync = _search(tokens, lambda token: token.start >= offset + deleted)
+    return _scan(
+        scanner, input, start, tokens[:first], tokens,
+        len(inserted) - deleted, resync
+    )
+
+
+def _search(tokens: List[Token], predicate: Callable[[Token], bool]) -> int:
+    lo, hi = 0, len(tokens)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if predicate(tokens[mid]):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def _scan(scanner: Scanner, input: Input, pos: int, result: List[Token],
+          old: List[Token], delta: int, index: int) -> List[Token]:
+    table = scanner.get_table()
+    names = scanner.get_tags()
+    reach = result[-1].reach if result else 0
+    with memoryview(input) as view:
+        size = len(view)
+        while pos < size:
+            while index < len(old) and old[index].start + delta < pos:
+                index += 1
+            if index < len(old) and old[index].start + delta == pos:
+                if delta == 0 and old[index].reach >= reach:
+                    result.extend(old[index:])
+                else:
+                    result.extend([
+                        Token(
+                            tag, start + delta, end + delta,
+                            max(reach, old_reach + delta)
+                        )
+                        for tag, start, end, old_reach in old[index:]
+                    ])
+                return result
+            tag, end, stop = table.scan_reach(view, pos)
+            if tag is None:
+                raise ValueError("Input not recognized")
+            reach = max(reach, stop)
+            result.append(Token(names[tag], pos, end, reach))
+            pos = end
+    return result
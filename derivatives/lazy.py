@@ -0,0 +1,118 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .dfa import DfaTable, Scanner
+from .partition import CHARSET_END
+from .vector import Vector
+
+UNKNOWN = -2
+
+MAX_STATES = 10000
+
+
+class LazyTable(DfaTable):
+    def __init__(self, vector: Vector,
+                 tag_resolver: Callable[[List[int]], str], names: List[str],
+                 max_states: int):
+        self.targets: List[int] = []
+        self.tags: List[Optional[int]] = []
+        self.flushes = 0
+        self._vector = vector
+        self._tag_resolver = tag_resolver
+        self._names = names
+        self._name_ids = {name: index for index, name in enumerate(names)}
+        self._resolved: Dict[Tuple[int, ...], int] = {}
+        self._max_states = max_states
+        self._vectors: List[Vector] = []
+        self._vector_to_state: Dict[Vector, int] = {}
+        self._add_state(vector)
+
+    def state_count(self) -> int:
+        return len(self._vectors)
+
+    def _add_state(self, vector: Vector) -> int:
+        state = self._vector_to_state.get(vector)
+        if state is None:
+            state = len(self._vectors) * CHARSET_END
+            self._vector_to_state[vector] = state
+            self._vectors.append(vector)
+            self.targets.extend([UNKNOWN] * CHARSET_END)
+            self.tags.extend([None] * CHARSET_END)
+        return state
+
+    def _resolve(self, tags: List[int]) -> int:
+        key = tuple(tags)
+        tag = self._resolved.get(key)
+        if tag is None:
+            name = self._tag_resolver(tags)
+            tag = self._name_ids.get(name)
+            if tag is None:
+                tag = self._name_ids[name] = len(self._names)
+                self._names.append(name)
+            self._resolved[key] = tag
+        return tag
+
+    def _flush(self, vector: Vector) -> int:
+        self.flushes += 1
+        del self.targets[:]
+        del self.tags[:]
+        del self._vectors[:]
+        self._vector_to_state.clear()
+        self._add_state(self._vector)
+        return self._add_state(vector)
+
+    def _expand(self, state: int) -> int:
+        vector = self._vectors[state // CHARSET_END]
+        if len(self._vectors) >= self._max_states:
+            state = self._flush(vector)
+        targets: List[int] = []
+        tags: List[Optional[int]] = []
+        last = 0
+        for end, (target_tags, target_vector) in vector.transitions():
+            count = end - last
+            target = self._add_state(target_vector) if target_vector else -1
+            tag = self._resolve(target_tags) if target_tags else None
+            targets.extend([target] * count)
+            tags.extend([tag] * count)
+            last = end
+        self.targets[state:state + CHARSET_END] = targets
+        self.tags[state:state + CHARSET_END] = tags
+        return state
+
+    def advance(
+            self, input: memoryview, start: int, state: int,
+            tag: Optional[int], end: int
+    ) -> Tuple[int, Optional[int], int, int]:
+        targets = self.targets
+        tags = self.tags
+        for pos, code in enumerate(input[start:], start):
+            target = targets[state + code]
+            if target == UNKNOWN:
+                state = self._expand(state)
+                target = targets[state + code]
+            new_tag = tags[state + code]
+            if new_tag is not None:
+                tag = new_tag
+                end = pos + 1
+            state = target
+            if state < 0:
+                return state, tag, end, pos + 1
+        return state, tag, end, len(input)
+
+    def finish(self, state: int, tag: Optional[int], end: int,
+               size: int) -> Tuple[Optional[int], int]:
+        return tag, end
+
+
+class LazyDfa(Scanner):
+    def __init__(self, vector: Vector,
+                 tag_resolver: Callable[[List[int]], str],
+                 max_states: int = MAX_STATES,
+                 names: Optional[List[str]] = None):
+        self._tags: List[str] = list(names or [])
+        self._table = LazyTable(vector, tag_resolver, self._tags, max_states)
+
+    def get_tags(self) -> List[str]:
+        return self._tags
+
+    def get_table(self) -> LazyTable:
+        return self._table
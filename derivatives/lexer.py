@@ -1,7 +1,14 @@
-from typing import Callable, Dict, List, Tuple
+import os
+import sys
+from hashlib import sha256
+from tempfile import NamedTemporaryFile
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
-from .dfa import Dfa, make_dfa
+from .core import CRegex, fingerprint
+from .dfa import Dfa, DfaStats, TransitionMemo, make_dfa
 from .edsl import Regex
+from .lazy import MAX_STATES, LazyDfa
+from .serialize import VERSION, dumps, load
 from .vector import Vector, VectorItem
 
 TagResolver = Callable[[List[int], Dict[int, str]], str]
@@ -21,10 +28,33 @@ def raise_on_conflict(tags: List[int], names: Dict[int, str]) -> str:
     )
 
 
-def make_lexer(
-        tokens: List[Tuple[str, Regex]],
-        tag_resolver: TagResolver = raise_on_conflict) -> Dfa:
+def _resolver_name(tag_resolver: TagResolver) -> Optional[str]:
+    module = getattr(tag_resolver, "__module__", None)
+    qualname = getattr(tag_resolver, "__qualname__", None)
+    if module not in sys.modules or not isinstance(qualname, str):
+        return None
+    if getattr(sys.modules[module], qualname, None) is not tag_resolver:
+        return None
+    return "{}.{}".format(module, qualname)
+
+
+def lexer_fingerprint(
+        tokens: List[Tuple[str, Regex]], tag_resolver: TagResolver,
+        minimize: bool = False) -> Optional[str]:
+    resolver = _resolver_name(tag_resolver)
+    if resolver is None:
+        return None
+    memo: Dict[CRegex, bytes] = {}
+    digest = sha256(repr((VERSION, minimize, resolver)).encode())
+    for name, regex in tokens:
+        digest.update(repr(name).encode())
+        digest.update(fingerprint(regex.getvalue(), memo))
+    return digest.hexdigest()
 
+
+def make_vector(
+        tokens: List[Tuple[str, Regex]], tag_resolver: TagResolver
+) -> Tuple[Vector, Callable[[List[int]], str], List[str]]:
     items: List[VectorItem] = []
     names: Dict[int, str] = {}
     for i, (name, regex) in enumerate(tokens):
@@ -34,4 +64,98 @@ def make_lexer(
     def dfa_tag_resolver(tags: List[int]) -> str:
         return tag_resolver(tags, names)
 
-    return make_dfa(Vector(items), dfa_tag_resolver)
+    return Vector(items), dfa_tag_resolver, list(dict.fromkeys(names.values()))
+
+
+def make_lexer(
+        tokens: List[Tuple[str, Regex]],
+        tag_resolver: TagResolver = raise_on_conflict,
+        minimize: bool = False,
+        cache_dir: Optional[str] = None,
+        workers: Optional[int] = None,
+        stats: Optional[DfaStats] = None) -> Dfa:
+
+    path: Optional[str] = None
+    if cache_dir is not None:
+        key = lexer_fingerprint(tokens, tag_resolver, minimize)
+        if key is not None:
+            path = os.path.join(cache_dir, key + ".dfa")
+    if path is not None:
+        try:
+            with open(path, "rb") as fp:
+                dfa = load(fp)
+            if stats is not None:
+                stats.cache_hit = True
+            return dfa
+        except (OSError, ValueError):
+            pass
+
+    vector, dfa_tag_resolver, names = make_vector(tokens, tag_resolver)
+    dfa = make_dfa(
+        vector, dfa_tag_resolver, minimize, workers, stats, names=names
+    )
+
+    if path is not None:
+        _write_cache(path, dumps(dfa))
+
+    return dfa
+
+
+def _write_cache(path: str, data: bytes) -> None:
+    directory = os.path.dirname(path)
+    tmp_name: Optional[str] = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with NamedTemporaryFile(dir=directory, delete=False) as tmp:
+            tmp_name = tmp.name
+            tmp.write(data)
+        os.replace(tmp_name, path)
+    except OSError:
+        if tmp_name is not None:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+
+
+def make_lazy_lexer(
+        tokens: List[Tuple[str, Regex]],
+        tag_resolver: TagResolver = raise_on_conflict,
+        max_states: int = MAX_STATES) -> LazyDfa:
+    vector, dfa_tag_resolver, names = make_vector(tokens, tag_resolver)
+    return LazyDfa(vector, dfa_tag_resolver, max_states, names)
+
+
+class LexerBuilder:
+    def __init__(self, tag_resolver: TagResolver = raise_on_conflict,
+                 minimize: bool = False, workers: Optional[int] = None):
+        self._tag_resolver = tag_resolver
+        self._minimize = minimize
+        self._workers = workers
+        self._regexes: List[CRegex] = []
+        self._memo: TransitionMemo = {}
+
+    def memo_size(self) -> int:
+        return len(self._memo)
+
+    def build(self, tokens: List[Tuple[str, Regex]],
+              stats: Optional[DfaStats] = None) -> Dfa:
+        regexes = [regex.getvalue() for _, regex in tokens]
+        changed: Set[int] = set(range(len(regexes), len(self._regexes)))
+        for index, regex in enumerate(regexes):
+            if index >= len(self._regexes) or \
+                    self._regexes[index] is not regex:
+                changed.add(index)
+        if changed:
+            for vector in list(self._memo):
+                if not changed.isdisjoint(vector.tags()):
+                    del self._memo[vector]
+        self._regexes = regexes
+
+        vector, dfa_tag_resolver, names = make_vector(
+            tokens, self._tag_resolver
+        )
+        return make_dfa(
+            vector, dfa_tag_resolver, self._minimize, self._workers, stats,
+            self._memo, names
+        )
@@ -0,0 +1,171 @@
+import ctypes
+import os
+import subprocess
+from array import array
+from hashlib import sha256
+from tempfile import NamedTemporaryFile, gettempdir
+from typing import Iterator, List, Optional, Tuple
+
+from .codegen import generate_c
+from .dfa import COLUMN_BATCH_SIZE, Dfa, Input, TokenColumns, make_columns
+from .serialize import dumps
+
+WRAPPER_VERSION = 1
+
+BATCH_SIZE = 4096
+
+CFLAGS = ["-O2", "-shared", "-fPIC"]
+
+WRAPPER = """
+#define DFA_USE_LIMIT
+
+{header}
+
+long dfa_scan(const char *data, long size, long start, uint32_t *tokens,
+              int64_t *ends, long capacity, int64_t *next) {{
+    struct DfaMatch match;
+    const char *s = data + start;
+    const char *limit = data + size;
+    long count = 0;
+
+    while (s != limit && count < capacity) {{
+        dfa_match(s, limit, &match);
+        if (match.token == DFA_INVALID_TOKEN || match.end == s) {{ break; }}
+        tokens[count] = match.token - 1;
+        ends[count] = match.end - data;
+        count += 1;
+        s = match.end;
+    }}
+    *next = s - data;
+    return count;
+}}
+"""
+
+
+def default_cache_dir() -> str:
+    return os.path.join(gettempdir(), "derivatives-native")
+
+
+def native_source(dfa: Dfa, mode: str) -> str:
+    return WRAPPER.format(header=generate_c(dfa, mode))
+
+
+def native_fingerprint(dfa: Dfa, mode: str, compiler: str) -> str:
+    digest = sha256(repr((WRAPPER_VERSION, mode, compiler, CFLAGS)).encode())
+    digest.update(dumps(dfa))
+    return digest.hexdigest()
+
+
+def compile_native(
+        dfa: Dfa, mode: str = "binary", cache_dir: Optional[str] = None,
+        compiler: Optional[str] = None) -> str:
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    if compiler is None:
+        compiler = os.environ.get("CC", "cc")
+    key = native_fingerprint(dfa, mode, compiler)
+    path = os.path.join(cache_dir, key + ".so")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with NamedTemporaryFile(
+            "w", dir=cache_dir, suffix=".c", delete=False) as source:
+        source.write(native_source(dfa, mode))
+    with NamedTemporaryFile(dir=cache_dir, suffix=".so", delete=False) as tmp:
+        pass
+    try:
+        subprocess.run(
+            [compiler, *CFLAGS, "-o", tmp.name, source.name],
+            check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        os.replace(tmp.name, path)
+    finally:
+        os.unlink(source.name)
+        if os.path.exists(tmp.name):
+            os.unlink(tmp.name)
+    return path
+
+
+class NativeScanner:
+    def __init__(self, path: str, tags: List[str]):
+        self._tags = tags
+        self._library = ctypes.CDLL(path)
+        self._scan = self._library.dfa_scan
+        self._scan.restype = ctypes.c_long
+        self._scan.argtypes = [
+            ctypes.c_char_p, ctypes.c_long, ctypes.c_long,
+            ctypes.POINTER(ctypes.c_uint32), ctypes.POINTER(ctypes.c_int64),
+            ctypes.c_long, ctypes.POINTER(ctypes.c_int64),
+        ]
+
+    def get_tags(self) -> List[str]:
+        return self._tags
+
+    def scan_ids(self, input: Input,
+                 start: int = 0) -> Iterator[Tuple[int, int, int]]:
+        data = input if isinstance(input, bytes) else bytes(input)
+        size = len(data)
+        tokens = (ctypes.c_uint32 * BATCH_SIZE)()
+        ends = (ctypes.c_int64 * BATCH_SIZE)()
+        next = ctypes.c_int64()
+        while start < size:
+            count = self._scan(
+                data, size, start, tokens, ends, BATCH_SIZE,
+                ctypes.byref(next)
+            )
+            for token, end in zip(tokens[:count], ends[:count]):
+                yield token, start, end
+                start = end
+            if count < BATCH_SIZE and start < size:
+                raise ValueError("Input not recognized")
+
+    def scan_columns(self, input: Input, start: int = 0) -> TokenColumns:
+        ids = array("I")
+        ends = array("q")
+        for columns in self.iter_columns(input, start):
+            ids.extend(columns.ids)
+            ends.extend(columns.ends)
+        return make_columns(ids, ends, start)
+
+    def iter_columns(
+            self, input: Input, start: int = 0,
+            batch_size: int = COLUMN_BATCH_SIZE) -> Iterator[TokenColumns]:
+        data = input if isinstance(input, bytes) else bytes(input)
+        size = len(data)
+        next = ctypes.c_int64()
+        while start < size:
+            ids = array("I", bytes(4 * batch_size))
+            ends = array("q", bytes(8 * batch_size))
+            ids_buffer = (ctypes.c_uint32 * batch_size).from_buffer(ids)
+            ends_buffer = (ctypes.c_int64 * batch_size).from_buffer(ends)
+            count = self._scan(
+                data, size, start, ids_buffer, ends_buffer, batch_size,
+                ctypes.byref(next)
+            )
+            del ids_buffer, ends_buffer
+            del ids[count:]
+            del ends[count:]
+            if count:
+                yield make_columns(ids, ends, start)
+                start = ends[-1]
+            if count < batch_size and start < size:
+                raise ValueError("Input not recognized")
+
+    def scan_spans(self, input: Input,
+                   start: int = 0) -> Iterator[Tuple[str, int, int]]:
+        names = self._tags
+        for token, begin, end in self.scan_ids(input, start):
+            yield names[token], begin, end
+
+    def scan_all(self, input: Input) -> Iterator[Tuple[str, bytes]]:
+        for tag, start, end in self.scan_spans(input):
+            yield tag, bytes(input[start:end])
+
+
+def make_native_scanner(
+        dfa: Dfa, mode: str = "binary", cache_dir: Optional[str] = None,
+        compiler: Optional[str] = None) -> NativeScanner:
+    return NativeScanner(
+        compile_native(dfa, mode, cache_dir, compiler), dfa.get_tags()
+    )
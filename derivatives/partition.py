@@ -1,45 +1,176 @@
-from typing import Callable, Iterable, Iterator, List, Tuple, TypeVar
+from array import array
+from bisect import bisect_right
+from typing import (
+    Any, Callable, Generic, Iterable, Iterator, List, Tuple, TypeVar
+)
 
 CHARSET_END = 0x100
 
+MERGE_ALL_MIN_SIZE = 3
+
 T = TypeVar('T')
 U = TypeVar('U')
-Partition = List[Tuple[int, T]]
+V = TypeVar('V')
 IterablePartition = Iterable[Tuple[int, T]]
 PartitionIterator = Iterator[Tuple[int, T]]
 
 
+class Partition(Generic[T]):
+
+    __slots__ = ("ends", "values")
+
+    def __init__(self, ends: "array[int]", values: List[T]):
+        self.ends = ends
+        self.values = values
+
+    @classmethod
+    def single(cls, value: T) -> "Partition[T]":
+        return cls(array("H", (CHARSET_END,)), [value])
+
+    @classmethod
+    def from_items(cls, items: IterablePartition[T]) -> "Partition[T]":
+        ends = array("H")
+        values: List[T] = []
+        for end, value in items:
+            ends.append(end)
+            values.append(value)
+        return cls(ends, values)
+
+    def lookup(self, code: int) -> T:
+        return self.values[bisect_right(self.ends, code)]
+
+    def coalesce(self) -> "Partition[T]":
+        ends = array("H")
+        values: List[T] = []
+        for end, value in zip(self.ends, self.values):
+            if values and values[-1] is value:
+                ends[-1] = end
+            else:
+                ends.append(end)
+                values.append(value)
+        return Partition(ends, values)
+
+    def key(self) -> Tuple[bytes, Tuple[T, ...]]:
+        return self.ends.tobytes(), tuple(self.values)
+
+    def __iter__(self) -> PartitionIterator[T]:
+        return zip(self.ends, self.values)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Partition):
+            return self.ends == other.ends and self.values == other.values
+        return NotImplemented
+
+    __hash__ = None  # type: ignore
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return Partition, (self.ends, self.values)
+
+    def __repr__(self) -> str:
+        return "Partition({!r})".format(list(self))
+
+
+def merge_partitions(left: Partition[T], right: Partition[U],
+                     update: Callable[[T, U], V],
+                     update_copy: Callable[[T, U], V]) -> Partition[V]:
+    left_ends = left.ends
+    left_values = left.values
+    right_ends = right.ends
+    right_values = right.values
+    if len(right_values) == 1:
+        value = right_values[0]
+        return Partition(
+            left_ends, [update(item, value) for item in left_values]
+        )
+    if len(left_values) == 1:
+        item = left_values[0]
+        mapped = [update_copy(item, value) for value in right_values[:-1]]
+        mapped.append(update(item, right_values[-1]))
+        return Partition(right_ends, mapped)
+
+    ends = array("H")
+    values: List[V] = []
+    last = left_ends[-1]
+    i = j = 0
+    left_end = left_ends[0]
+    right_end = right_ends[0]
+    while True:
+        if left_end < right_end:
+            ends.append(left_end)
+            values.append(update(left_values[i], right_values[j]))
+            i += 1
+            left_end = left_ends[i]
+        elif left_end > right_end:
+            ends.append(right_end)
+            values.append(update_copy(left_values[i], right_values[j]))
+            j += 1
+            right_end = right_ends[j]
+        else:
+            ends.append(left_end)
+            values.append(update(left_values[i], right_values[j]))
+            if left_end == last:
+                return Partition(ends, values)
+            i += 1
+            j += 1
+            left_end = left_ends[i]
+            right_end = right_ends[j]
+
+
 def make_merge_fn(update: Callable[[T, U], T], update_copy: Callable[[T, U], T]
-                  ) -> Callable[[IterablePartition[T],
-                                 IterablePartition[U]], Partition[T]]:
-
-    def merge(acc: IterablePartition[T], val: IterablePartition[U]
-              ) -> Partition[T]:
-        result: Partition[T] = []
-        acc_it = iter(acc)
-        val_it = iter(val)
-        acc_end, acc_item = next(acc_it)
-        val_end, val_item = next(val_it)
-        try:
-            while True:
-                if acc_end == val_end:
-                    result.append((acc_end, update(acc_item, val_item)))
-                    acc_end, acc_item = next(acc_it)
-                    val_end, val_item = next(val_it)
-                elif acc_end < val_end:
-                    result.append((acc_end, update(acc_item, val_item)))
-                    acc_end, acc_item = next(acc_it)
-                else:
-                    result.append((val_end, update_copy(acc_item, val_item)))
-                    val_end, val_item = next(val_it)
-        except StopIteration:
-            return result
+                  ) -> Callable[[Partition[T], Partition[U]], Partition[T]]:
+
+    def merge(acc: Partition[T], val: Partition[U]) -> Partition[T]:
+        return merge_partitions(acc, val, update, update_copy)
 
     return merge
 
 
 def make_merge_copy_fn(update_copy: Callable[[T, U], T]
-                       ) -> Callable[[IterablePartition[T],
-                                      IterablePartition[U]], Partition[T]]:
+                       ) -> Callable[[Partition[T], Partition[U]],
+                                     Partition[T]]:
 
     return make_merge_fn(update_copy, update_copy)
+
+
+def _merge_pair(first: Partition[T], second: Partition[T],
+                skip: Any) -> Partition[List[T]]:
+
+    def pair(left: T, right: T) -> List[T]:
+        if left is skip:
+            return [] if right is skip else [right]
+        return [left] if right is skip else [left, right]
+
+    return merge_partitions(first, second, pair, pair)
+
+
+def merge_all(partitions: List[Partition[T]],
+              skip: Any = None) -> Partition[List[T]]:
+    if not partitions:
+        return Partition.single([])
+    if len(partitions) == 1:
+        partition = partitions[0]
+        return Partition(partition.ends, [
+            [] if value is skip else [value] for value in partition.values
+        ])
+    if len(partitions) < MERGE_ALL_MIN_SIZE:
+        first, second = partitions
+        return _merge_pair(first, second, skip)
+
+    ends = sorted(set().union(*[partition.ends for partition in partitions]))
+    positions = {end: index for index, end in enumerate(ends, 1)}
+    columns: List[List[T]] = [[] for _ in ends]
+    for partition in partitions:
+        start = 0
+        for end, value in zip(partition.ends, partition.values):
+            stop = positions[end]
+            if value is not skip:
+                if stop - start == 1:
+                    columns[start].append(value)
+                else:
+                    for column in columns[start:stop]:
+                        column.append(value)
+            start = stop
+    return Partition(array("H", ends), columns)
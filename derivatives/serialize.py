@@ -0,0 +1,202 @@
+import struct
+import sys
+from array import array
+from typing import BinaryIO, Dict, Iterable, List, Optional
+
+from .dfa import (
+    Dfa, DfaSelfLoop, DfaState, DfaTableColumns, DfaTransition
+)
+from .partition import CHARSET_END
+
+MAGIC = b"DRVDFA"
+VERSION = 2
+
+HEADER = struct.Struct("<6sHIIIIII")
+
+
+def _to_bytes(items: "array[int]") -> bytes:
+    if sys.byteorder == "big":
+        items = array(items.typecode, items)
+        items.byteswap()
+    return items.tobytes()
+
+
+def _from_bytes(typecode: str, data: memoryview, offset: int,
+                count: int) -> "array[int]":
+    items = array(typecode)
+    end = offset + count * items.itemsize
+    if end > len(data):
+        raise ValueError("Truncated DFA data")
+    items.frombytes(data[offset:end])
+    if sys.byteorder == "big":
+        items.byteswap()
+    return items
+
+
+def _to_ids(items: Iterable[Optional[int]]) -> "array[int]":
+    return array("i", (-1 if item is None else item for item in items))
+
+
+def _from_ids(items: "array[int]") -> List[Optional[int]]:
+    return [None if item < 0 else item for item in items]
+
+
+def dumps(dfa: Dfa) -> bytes:
+    tags = dfa.get_tags()
+    encoded_tags = [tag.encode("utf-8") for tag in tags]
+
+    entry_tags = array("i")
+    eof_tags = array("i")
+    counts = array("I")
+    ends = array("H")
+    targets = array("i")
+    transition_tags = array("i")
+    at_exits = array("B")
+    for _, (entry_tag, eof_tag, transitions) in dfa.iter_states():
+        entry_tags.append(-1 if entry_tag is None else entry_tag)
+        eof_tags.append(-1 if eof_tag is None else eof_tag)
+        counts.append(len(transitions))
+        for end, target, tag, at_exit in transitions:
+            ends.append(end)
+            targets.append(-1 if target is None else target)
+            transition_tags.append(-1 if tag is None else tag)
+            at_exits.append(at_exit)
+
+    columns = dfa.get_table_columns()
+    loops = dfa.get_self_loops()
+    range_starts = array("H")
+    range_ends = array("H")
+    for loop in loops.values():
+        for start, end in loop.ranges:
+            range_starts.append(start)
+            range_ends.append(end)
+
+    return b"".join([
+        HEADER.pack(
+            MAGIC, VERSION, len(tags), len(counts), len(ends),
+            len(columns.classes), len(loops), len(range_starts)
+        ),
+        _to_bytes(array("I", (len(tag) for tag in encoded_tags))),
+        *encoded_tags,
+        _to_bytes(entry_tags),
+        _to_bytes(eof_tags),
+        _to_bytes(counts),
+        _to_bytes(ends),
+        _to_bytes(targets),
+        _to_bytes(transition_tags),
+        _to_bytes(at_exits),
+        _to_bytes(array("B", columns.classes)),
+        _to_bytes(array("i", columns.targets)),
+        _to_bytes(_to_ids(columns.tags)),
+        _to_bytes(array("B", columns.deltas)),
+        _to_bytes(_to_ids(columns.eof_tags)),
+        _to_bytes(array("I", loops)),
+        _to_bytes(_to_ids(loop.tag for loop in loops.values())),
+        _to_bytes(array("B", (loop.at_exit for loop in loops.values()))),
+        _to_bytes(array("I", (len(loop.ranges) for loop in loops.values()))),
+        _to_bytes(range_starts),
+        _to_bytes(range_ends),
+    ])
+
+
+def loads(data: bytes) -> Dfa:
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise ValueError("Truncated DFA data")
+    (magic, version, n_tags, n_states, n_transitions, n_classes, n_loops,
+     n_ranges) = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError("Not a serialized DFA")
+    if version != VERSION:
+        raise ValueError("Unsupported DFA format version: {}".format(version))
+    offset = HEADER.size
+
+    def read(typecode: str, count: int) -> "array[int]":
+        nonlocal offset
+        items = _from_bytes(typecode, view, offset, count)
+        offset += count * items.itemsize
+        return items
+
+    lengths = read("I", n_tags)
+    tags: List[str] = []
+    for length in lengths:
+        tags.append(bytes(view[offset:offset + length]).decode("utf-8"))
+        offset += length
+
+    entry_tags = read("i", n_states)
+    eof_tags = read("i", n_states)
+    counts = read("I", n_states)
+    ends = read("H", n_transitions)
+    targets = read("i", n_transitions)
+    transition_tags = read("i", n_transitions)
+    at_exits = read("B", n_transitions)
+
+    if n_classes != (CHARSET_END if n_states else 0):
+        raise ValueError("Invalid byte classes in DFA data")
+    classes = read("B", n_classes)
+    width = max(classes) + 1 if classes else 0
+    table_targets = read("i", n_states * width)
+    table_tags = read("i", n_states * width)
+    table_deltas = read("B", n_states * width)
+    table_eof_tags = read("i", n_states)
+
+    loop_states = read("I", n_loops)
+    loop_tags = read("i", n_loops)
+    loop_at_exits = read("B", n_loops)
+    loop_counts = read("I", n_loops)
+    range_starts = read("H", n_ranges)
+    range_ends = read("H", n_ranges)
+
+    for tag_ids in (entry_tags, eof_tags, transition_tags, table_tags,
+                    table_eof_tags, loop_tags):
+        if tag_ids and max(tag_ids) >= n_tags:
+            raise ValueError("Invalid tag id in DFA data")
+    if table_targets and max(table_targets) >= n_states * CHARSET_END or \
+            loop_states and max(loop_states) >= n_states or \
+            sum(counts) != n_transitions or sum(loop_counts) != n_ranges:
+        raise ValueError("Invalid DFA data")
+
+    def load_states() -> List[DfaState]:
+        transitions = [
+            DfaTransition(
+                end, None if target < 0 else target,
+                None if tag < 0 else tag, at_exit != 0
+            )
+            for end, target, tag, at_exit in zip(
+                ends, targets, transition_tags, at_exits
+            )
+        ]
+        states: List[DfaState] = []
+        start = 0
+        for entry_tag, eof_tag, count in zip(entry_tags, eof_tags, counts):
+            states.append(DfaState(
+                None if entry_tag < 0 else entry_tag,
+                None if eof_tag < 0 else eof_tag,
+                transitions[start:start + count]
+            ))
+            start += count
+        return states
+
+    columns = DfaTableColumns(
+        list(classes), list(table_targets), _from_ids(table_tags),
+        list(table_deltas), _from_ids(table_eof_tags)
+    )
+    loops: Dict[int, DfaSelfLoop] = {}
+    start = 0
+    for state, tag, at_exit, count in zip(
+            loop_states, loop_tags, loop_at_exits, loop_counts):
+        loops[state] = DfaSelfLoop(
+            list(zip(range_starts[start:start + count],
+                     range_ends[start:start + count])),
+            None if tag < 0 else tag, at_exit != 0
+        )
+        start += count
+    return Dfa(None, tags, load_states, columns, loops)
+
+
+def dump(dfa: Dfa, fp: BinaryIO) -> None:
+    fp.write(dumps(dfa))
+
+
+def load(fp: BinaryIO) -> Dfa:
+    return loads(fp.read())
@@ -1,8 +1,8 @@
 from itertools import groupby
 from typing import Iterable, Iterator, List, Tuple
 
-from .core import EMPTY, CharClass, CRegex, Ranges
-from .partition import CHARSET_END
+from .core import EMPTY, CharClass, CRegex
+from .partition import CHARSET_END, Partition
 
 MAX_1_BYTE = 0x7F
 MAX_2_BYTE = 0x7FF
@@ -68,14 +68,14 @@ def encode_range(lo: int, hi: int) -> List[Tuple[int, int]]:
 
 
 def to_byte_regex(lo: int, hi: int) -> CRegex:
-    ranges: Ranges = []
+    items: List[Tuple[int, bool]] = []
     if lo > 0:
-        ranges.append((lo, False))
+        items.append((lo, False))
     end = hi + 1
-    ranges.append((end, True))
+    items.append((end, True))
     if end < CHARSET_END:
-        ranges.append((CHARSET_END, False))
-    return CharClass(ranges)
+        items.append((CHARSET_END, False))
+    return CharClass(Partition.from_items(items))
 
 
 def to_prefix_tree(byte_ranges: Iterable[List[Tuple[int, int]]]) -> CRegex:
@@ -1,54 +1,48 @@
-from typing import List, Optional, Tuple
+from typing import List, Optional, Tuple, cast
 
 from .core import EMPTY, EPSILON, CRegex
-from .partition import CHARSET_END, PartitionIterator, Partition, make_merge_fn
+from .partition import Partition, PartitionIterator, merge_all
 
 VectorItem = Tuple[int, CRegex]
 
 
-def vector_append_copy(
-        left: List[VectorItem],
-        right: Optional[VectorItem]) -> List[VectorItem]:
-    copy = left.copy()
-    if right is not None:
-        copy.append(right)
-    return copy
-
-
-def vector_append_inplace(
-        left: List[VectorItem],
-        right: Optional[VectorItem]) -> List[VectorItem]:
-    if right is not None:
-        left.append(right)
-    return left
-
-
-vector_append = make_merge_fn(vector_append_inplace, vector_append_copy)
-
-
 class Vector:
     def __init__(self, items: List[VectorItem]):
         self._items = items
+        self._hash: Optional[int] = None
 
     def transitions(self) -> PartitionIterator[Tuple[List[int], "Vector"]]:
-        partial: Partition[List[VectorItem]] = [(CHARSET_END, [])]
+        partitions: List[Partition[Optional[VectorItem]]] = []
         for tag, item in self._items:
-            partial = vector_append(
-                partial,
-                (
-                    (end, None if regex == EMPTY else (tag, regex))
-                    for end, regex in item.derivatives()
-                )
-            )
-        for end, items in partial:
+            derivatives = item.derivatives()
+            partitions.append(Partition(
+                derivatives.ends,
+                [
+                    None if regex is EMPTY else (tag, regex)
+                    for regex in derivatives.values
+                ]
+            ))
+        merged = cast(Partition[List[VectorItem]], merge_all(partitions))
+        for end, items in merged:
             tags = [tag for tag, regex in items if regex.nullable()]
             vector = Vector(
-                [(tag, regex) for tag, regex in items if regex != EPSILON]
+                [(tag, regex) for tag, regex in items if regex is not EPSILON]
             )
             yield (end, (tags, vector))
 
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def tags(self) -> List[int]:
+        return [tag for tag, _ in self._items]
+
+    def __reduce__(self) -> Tuple[type, Tuple[List[VectorItem]]]:
+        return Vector, (self._items,)
+
     def __hash__(self) -> int:
-        return hash(tuple(self._items))
+        if self._hash is None:
+            self._hash = hash(tuple(self._items))
+        return self._hash
 
     def __eq__(self, other: object) -> bool:
         if isinstance(other, Vector):
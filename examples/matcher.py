@@ -1,10 +1,12 @@
+from typing import List, Tuple
+
 from derivatives import (
-    any_with, any_without, char, generate_c, generate_dot, make_lexer
+    Regex, any_with, any_without, char, generate_c, generate_dot, make_lexer
 )
 
 
-def main() -> None:
-    lex = make_lexer([
+def tokens() -> List[Tuple[str, Regex]]:
+    return [
         (
             "re",
             (
@@ -13,7 +15,11 @@ def main() -> None:
                 any_with(char("b") * char("b"))
             )
         )
-    ])
+    ]
+
+
+def main() -> None:
+    lex = make_lexer(tokens())
     with open("matcher.dot", "w") as fp:
         fp.write(generate_dot(lex))
 
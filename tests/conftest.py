@@ -0,0 +1,15 @@
+import pytest
+
+from derivatives import (
+    char_range, char_set, make_lexer, select_first, string
+)
+
+
+@pytest.fixture
+def lexer():
+    return make_lexer([
+        ("if", string("if")),
+        ("ident", char_range("a", "z").plus()),
+        ("number", char_range("0", "9").plus()),
+        ("space", char_set(" \n").plus()),
+    ], select_first)
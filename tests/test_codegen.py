@@ -0,0 +1,98 @@
+import shutil
+import subprocess
+
+import pytest
+
+from derivatives import empty, make_lexer
+from derivatives.codegen import C_MODES, generate_c, generate_python
+
+C_DRIVER = r"""
+#include <stdio.h>
+#include <string.h>
+
+#include "lexer.h"
+
+int main(int argc, char **argv) {
+    const char *s = argv[1];
+    struct DfaMatch match;
+
+    while (*s) {
+#ifdef DFA_USE_LIMIT
+        dfa_match(s, s + strlen(s), &match);
+#else
+        dfa_match(s, &match);
+#endif
+        if (match.token == DFA_INVALID_TOKEN) { return 1; }
+        printf("%s %d\n", dfa_token_name(match.token), (int)(match.end - s));
+        s = match.end;
+    }
+    return 0;
+}
+"""
+
+
+def test_generate_python(lexer):
+    namespace = {}
+    exec(compile(generate_python(lexer), "<lexer>", "exec"), namespace)
+    source = b"if iffy\n42 else"
+    assert list(namespace["scan_all"](source)) == \
+        list(lexer.scan_all(source))
+    for _, value in namespace["scan_all"](bytearray(source)):
+        assert type(value) is bytes
+    assert list(namespace["scan_spans"](source, 3)) == \
+        list(lexer.scan_spans(source, 3))
+    assert namespace["scan_once"](b"if") == lexer.scan_once(b"if")
+    assert namespace["scan_once"](b"!") is None
+    with pytest.raises(ValueError):
+        list(namespace["scan_all"](b"if!"))
+
+
+def test_generate_python_no_states():
+    namespace = {}
+    lexer = make_lexer([("x", empty())])
+    exec(compile(generate_python(lexer), "<lexer>", "exec"), namespace)
+    assert namespace["scan_once"](b"x") is None
+    assert list(namespace["scan_all"](b"")) == []
+    with pytest.raises(ValueError):
+        list(namespace["scan_all"](b"x"))
+
+
+def test_generate_c_unknown_mode(lexer):
+    with pytest.raises(ValueError):
+        generate_c(lexer, "jit")
+
+
+@pytest.mark.skipif(shutil.which("cc") is None, reason="no C compiler")
+@pytest.mark.parametrize("limit", [False, True])
+@pytest.mark.parametrize("mode", C_MODES)
+def test_generate_c(lexer, tmp_path, mode, limit):
+    (tmp_path / "lexer.h").write_text(generate_c(lexer, mode))
+    (tmp_path / "driver.c").write_text(C_DRIVER)
+    binary = str(tmp_path / "driver")
+    subprocess.run(
+        [
+            "cc", *(["-DDFA_USE_LIMIT"] if limit else []), "-o", binary,
+            str(tmp_path / "driver.c"),
+        ],
+        check=True,
+    )
+    source = b"if iffy\n42 else"
+    output = subprocess.run(
+        [binary, source.decode("ascii")], check=True, stdout=subprocess.PIPE
+    ).stdout.decode("ascii")
+    assert output.splitlines() == [
+        "{} {}".format(tag, len(text)) for tag, text in lexer.scan_all(source)
+    ]
+
+
+@pytest.mark.skipif(shutil.which("cc") is None, reason="no C compiler")
+@pytest.mark.parametrize("mode", C_MODES)
+def test_generate_c_no_states(tmp_path, mode):
+    lexer = make_lexer([("x", empty())])
+    (tmp_path / "lexer.h").write_text(generate_c(lexer, mode))
+    (tmp_path / "driver.c").write_text(C_DRIVER)
+    binary = str(tmp_path / "driver")
+    subprocess.run(
+        ["cc", "-o", binary, str(tmp_path / "driver.c")], check=True
+    )
+    assert subprocess.run([binary, "x"]).returncode == 1
@@ -0,0 +1,55 @@
+import pickle
+
+from derivatives import char, char_range, string
+from derivatives.core import (
+    Intersect, Union, clear_caches, interned_count, interned_nodes
+)
+from derivatives.partition import Partition
+
+
+def test_interning():
+    a = (string("ab") | char_range("0", "9")).star().getvalue()
+    b = (string("ab") | char_range("0", "9")).star().getvalue()
+    assert a is b
+    assert hash(a) == hash(b)
+    assert char("a").getvalue() is not char("b").getvalue()
+    nodes = list(interned_nodes())
+    assert any(node is a for node in nodes)
+    assert len(nodes) == interned_count()
+
+
+def test_cached_derivatives():
+    regex = (char("a") * char("b")).star().getvalue()
+    assert regex.derivatives() is regex.derivatives()
+    assert regex.nullable()
+    clear_caches()
+    assert regex.derivatives() == regex.derivatives()
+
+
+def test_pickle_reorders_items():
+    a = (string("ab") * char("c")).getvalue()
+    b = (string("cd") * char("e")).getvalue()
+    for cls in (Union, Intersect):
+        regex = cls(sorted([a, b]))
+        data = pickle.dumps(regex)
+        assert pickle.loads(data) is regex
+        swapped = cls([b, a] if a < b else [a, b])
+        assert pickle.loads(pickle.dumps(swapped)) is regex
+
+
+def test_many_way_derivatives():
+    words = ["w{:03}".format(i) for i in range(50)] + ["x", "wx"]
+    regexes = sorted({string(word).getvalue() for word in words})
+    for cls, fold in ((Union, "union"), (Intersect, "intersect")):
+        expected = regexes[0].derivatives()
+        for regex in regexes[1:]:
+            expected = Partition.from_items([
+                (end, getattr(left, fold)(right))
+                for end, left, right in _pairs(expected, regex.derivatives())
+            ])
+        assert list(cls(regexes).derivatives()) == list(expected)
+
+
+def _pairs(left, right):
+    ends = sorted(set(left.ends) | set(right.ends))
+    return [(end, left.lookup(end - 1), right.lookup(end - 1)) for end in ends]
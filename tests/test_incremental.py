@@ -0,0 +1,56 @@
+import pytest
+
+from derivatives import (
+    any_without, char_range, char_set, make_lexer, select_first, string
+)
+from derivatives.incremental import Token, relex, scan_tokens
+
+
+@pytest.fixture
+def lexer():
+    return make_lexer([
+        ("comment", string("/*") * any_without(string("*/")) * string("*/")),
+        ("if", string("if")),
+        ("ident", char_range("a", "z").plus()),
+        ("number", char_range("0", "9").plus()),
+        ("space", char_set(" \n").plus()),
+        ("divop", string("/")),
+        ("mulop", string("*")),
+    ], select_first)
+
+
+def test_scan_tokens(lexer):
+    source = b"if x /* c */ 42"
+    tokens = scan_tokens(lexer, source)
+    assert [token[:3] for token in tokens] == list(lexer.scan_spans(source))
+    assert tokens[0] == Token("if", 0, 2, 3)
+    assert tokens[-1].reach == len(source) + 1
+    assert all(a.reach <= b.reach for a, b in zip(tokens, tokens[1:]))
+
+
+@pytest.mark.parametrize("offset, deleted, inserted", [
+    (0, 0, b"a"),
+    (1, 1, b"f"),
+    (2, 0, b"fy"),
+    (5, 0, b"/* "),
+    (7, 5, b""),
+    (15, 0, b"7 */"),
+    (0, 15, b""),
+    (3, 1, b"if 12"),
+])
+def test_relex(lexer, offset, deleted, inserted):
+    source = b"if x /* c */ 42"
+    tokens = scan_tokens(lexer, source)
+    edited = source[:offset] + inserted + source[offset + deleted:]
+    result = relex(lexer, tokens, edited, offset, deleted, inserted)
+    assert [token[:3] for token in result] == list(lexer.scan_spans(edited))
+    assert all(
+        new.reach >= full.reach
+        for new, full in zip(result, scan_tokens(lexer, edited))
+    )
+
+
+def test_relex_errors(lexer):
+    tokens = scan_tokens(lexer, b"if x")
+    with pytest.raises(ValueError):
+        relex(lexer, tokens, b"if !x", 3, 0, b"!")
@@ -1,8 +1,12 @@
+import io
+
 import pytest
 
 from derivatives import (
-    any_char, any_without, char, char_range, char_set, make_lexer, string
+    DfaStats, LexerBuilder, any_char, any_without, char, char_range,
+    char_set, make_lazy_lexer, make_lexer, string
 )
+from derivatives.core import clear_caches
 from derivatives.lexer import select_first
 
 
@@ -162,3 +166,233 @@ TEST_TOKENS = [
 
 def test_lexer(c_lexer):
     assert list(c_lex(c_lexer, TEST_SOURCE)) == TEST_TOKENS
+
+
+def test_token_at_end_of_input(c_lexer):
+    assert list(c_lex(c_lexer, "x /* y */")) == [
+        ('ident', 'x'), ('comment', '/* y */')
+    ]
+
+
+def test_scan_spans(c_lexer):
+    source = TEST_SOURCE.encode('utf-8')
+    spans = list(c_lexer.scan_spans(source))
+    assert [
+        (tag, source[start:end]) for tag, start, end in spans
+    ] == list(c_lexer.scan_all(source))
+    assert list(c_lexer.scan_spans(memoryview(source))) == spans
+    assert list(c_lexer.scan_spans(bytearray(source))) == spans
+    assert spans[0][1] == 0 and spans[-1][2] == len(source)
+    for tag, value in c_lexer.scan_all(memoryview(source)):
+        assert type(value) is bytes
+
+
+def test_scan_columns(c_lexer):
+    source = TEST_SOURCE.encode('utf-8')
+    tags = c_lexer.get_tags()
+    spans = list(c_lexer.scan_spans(source))
+    columns = c_lexer.scan_columns(source)
+    assert columns.ids.typecode == 'I' and columns.ends.typecode == 'q'
+    assert [
+        (tags[id], start, end) for id, start, end in zip(*columns)
+    ] == spans
+    batches = list(c_lexer.iter_columns(bytearray(source), batch_size=3))
+    assert all(len(batch.ids) == 3 for batch in batches[:-1])
+    assert [
+        (tags[id], start, end)
+        for batch in batches for id, start, end in zip(*batch)
+    ] == spans
+    assert c_lexer.scan_columns(source, len(source)).ids.tolist() == []
+    with pytest.raises(ValueError):
+        c_lexer.scan_columns(b"x \x80")
+
+
+def test_tag_ids(c_tokens, c_lexer):
+    names = list(dict.fromkeys(name for name, _ in c_tokens))
+    assert c_lexer.get_tags() == names
+    for _, (entry_tag, eof_tag, transitions) in c_lexer.iter_states():
+        for tag in (entry_tag, eof_tag, *(t.tag for t in transitions)):
+            assert tag is None or 0 <= tag < len(names)
+    lazy = make_lazy_lexer(c_tokens, select_first)
+    assert lazy.get_tags() == names
+    source = TEST_SOURCE.encode('utf-8')
+    assert lazy.scan_columns(source) == c_lexer.scan_columns(source)
+    duplicated = make_lexer(
+        [("word", string("if")), ("word", char_range("a", "z").plus())],
+        select_first
+    )
+    assert duplicated.get_tags() == ["word"]
+
+
+def test_columns_to_numpy(c_lexer):
+    numpy = pytest.importorskip("numpy")
+    columns = c_lexer.scan_columns(TEST_SOURCE.encode('utf-8'))
+    ids, starts, ends = columns.to_numpy()
+    assert ids.dtype == numpy.uint32 and ends.dtype == numpy.int64
+    assert ids.tolist() == columns.ids.tolist()
+    assert (ends - starts).tolist() == [
+        end - start for start, end in zip(columns.starts, columns.ends)
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 1 << 16])
+def test_scan_stream(c_lexer, chunk_size):
+    source = (TEST_SOURCE + "/* tail */").encode('utf-8')
+    expected = list(c_lexer.scan_all(source))
+    chunks = [
+        source[i:i + chunk_size] for i in range(0, len(source), chunk_size)
+    ]
+    assert list(c_lexer.scan_stream(chunks)) == expected
+    stream = io.BytesIO(source)
+    assert list(c_lexer.scan_stream(stream, chunk_size)) == expected
+
+
+def test_scan_file(c_lexer, tmp_path):
+    source = TEST_SOURCE.encode('utf-8')
+    path = tmp_path / "source.c"
+    path.write_bytes(source)
+    assert list(c_lexer.scan_file(path)) == list(c_lexer.scan_spans(source))
+    path.write_bytes(b"")
+    assert list(c_lexer.scan_file(path)) == []
+
+
+def test_minimize(c_tokens, c_lexer):
+    minimized = make_lexer(c_tokens, select_first, minimize=True)
+    assert len(list(minimized.iter_states())) < \
+        len(list(c_lexer.iter_states()))
+    assert list(c_lex(minimized, TEST_SOURCE)) == TEST_TOKENS
+
+
+def test_byte_classes(c_lexer):
+    classes = c_lexer.get_byte_classes()
+    table = c_lexer.get_class_table()
+    assert len(classes) == 256
+    assert max(classes) + 1 < 128
+    for state, data in c_lexer.iter_states():
+        last = 0
+        for end, target, tag, at_exit in data.transitions:
+            for code in range(last, end):
+                assert table[state][classes[code]] == (target, tag, at_exit)
+            last = end
+
+
+def test_self_loops(c_lexer):
+    loops = c_lexer.get_self_loops()
+    assert loops
+    for state, (ranges, tag, at_exit) in loops.items():
+        transitions = list(c_lexer.iter_states())[state][1].transitions
+        for start, end in ranges:
+            for transition in transitions:
+                if start < transition.end and transition.end <= end:
+                    assert transition[1:] == (state, tag, at_exit)
+    source = "/* {} */ x /* {} *".format("a b\n" * 100, "c " * 100)
+    assert list(c_lex(c_lexer, source)) == [
+        ('comment', source[:source.index("x") - 1]), ('ident', 'x'),
+        ('divop', '/'), ('mulop', '*'),
+    ] + [('ident', 'c')] * 100 + [('mulop', '*')]
+
+
+def test_stats(c_tokens, tmp_path):
+    stats = DfaStats()
+    lexer = make_lexer(
+        c_tokens, select_first, minimize=True, cache_dir=str(tmp_path),
+        stats=stats
+    )
+    assert stats.states_explored >= stats.states_kept > \
+        stats.states_minimized == len(list(lexer.iter_states()))
+    assert stats.derivative_calls > 0
+    assert 0 <= stats.derivative_hit_rate() <= 1
+    assert 0 < stats.vector_hit_rate() < 1
+    assert stats.peak_nodes > 0
+    assert stats.max_vector_size == len(c_tokens)
+    assert set(stats.timings) == {"explore", "prune", "build", "minimize"}
+    assert not stats.cache_hit
+
+    stats = DfaStats()
+    make_lexer(
+        c_tokens, select_first, minimize=True, cache_dir=str(tmp_path),
+        stats=stats
+    )
+    assert stats.cache_hit
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_lexer_builder(c_tokens, workers):
+    builder = LexerBuilder(select_first, workers=workers)
+    assert list(c_lex(builder.build(c_tokens), TEST_SOURCE)) == TEST_TOKENS
+    size = builder.memo_size()
+
+    tokens = c_tokens + [("unless", string("unless"))]
+    lexer = builder.build(tokens)
+    expected = make_lexer(tokens, select_first)
+    assert list(lexer.iter_states()) == list(expected.iter_states())
+    assert lexer.get_tags() == expected.get_tags()
+    assert size < builder.memo_size() < 2 * size
+
+    tokens = c_tokens[:1] + c_tokens[2:]
+    lexer = builder.build(tokens)
+    expected = make_lexer(tokens, select_first)
+    assert list(lexer.iter_states()) == list(expected.iter_states())
+
+
+def test_cache_dir(c_tokens, tmp_path):
+    first = make_lexer(c_tokens, select_first, cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 1
+    second = make_lexer(c_tokens, select_first, cache_dir=str(tmp_path))
+    assert list(second.iter_states()) == list(first.iter_states())
+    assert list(c_lex(second, TEST_SOURCE)) == TEST_TOKENS
+    make_lexer(c_tokens[:-1], select_first, cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_cache_dir_not_writable(c_tokens, c_lexer, tmp_path, monkeypatch):
+    cache_file = tmp_path / "cache"
+    cache_file.write_bytes(b"")
+    lexer = make_lexer(c_tokens, select_first, cache_dir=str(cache_file))
+    assert list(lexer.iter_states()) == list(c_lexer.iter_states())
+
+    def fail(src, dst):
+        raise OSError("read-only file system")
+
+    monkeypatch.setattr("os.replace", fail)
+    cache_dir = tmp_path / "readonly"
+    lexer = make_lexer(c_tokens, select_first, cache_dir=str(cache_dir))
+    assert list(lexer.iter_states()) == list(c_lexer.iter_states())
+    assert not list(cache_dir.iterdir())
+
+
+def test_cache_dir_skips_closures(tmp_path):
+    def prio(order):
+        def resolve(tags, names):
+            return names[min(tags, key=order.index)]
+        return resolve
+
+    tokens = [("keyword", string("if")), ("name", char_range("a", "z").plus())]
+    for order, tag in (([0, 1], "keyword"), ([1, 0], "name")):
+        lexer = make_lexer(tokens, prio(order), cache_dir=str(tmp_path))
+        assert list(lexer.scan_all(b"if")) == [(tag, b"if")]
+    assert not list(tmp_path.iterdir())
+
+
+def test_parallel_construction(c_tokens, c_lexer):
+    lexer = make_lexer(c_tokens, select_first, workers=2)
+    assert list(lexer.iter_states()) == list(c_lexer.iter_states())
+    assert lexer.get_tags() == c_lexer.get_tags()
+
+
+def test_parallel_stats(c_tokens):
+    serial, parallel = DfaStats(), DfaStats()
+    clear_caches()
+    make_lexer(c_tokens, select_first, stats=serial)
+    clear_caches()
+    make_lexer(c_tokens, select_first, workers=2, stats=parallel)
+    assert parallel.states_explored == serial.states_explored
+    assert parallel.derivative_calls >= serial.derivative_calls
+    assert 0 < parallel.derivative_hits < parallel.derivative_calls
+
+
+@pytest.mark.parametrize("max_states", [4, 10000])
+def test_lazy_lexer(c_tokens, max_states):
+    lexer = make_lazy_lexer(c_tokens, select_first, max_states)
+    assert list(c_lex(lexer, TEST_SOURCE)) == TEST_TOKENS
+    assert lexer.get_table().state_count() <= max_states + 256
@@ -0,0 +1,47 @@
+import shutil
+
+import pytest
+
+from derivatives.native import make_native_scanner
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("cc") is None, reason="no C compiler"
+)
+
+
+def test_native_scanner(lexer, tmp_path):
+    scanner = make_native_scanner(lexer, cache_dir=str(tmp_path))
+    source = b"if iffy\n42 else" * 1000
+    assert list(scanner.scan_all(source)) == list(lexer.scan_all(source))
+    assert list(scanner.scan_spans(bytearray(source), 3)) == \
+        list(lexer.scan_spans(source, 3))
+    for _, value in scanner.scan_all(bytearray(source)):
+        assert type(value) is bytes
+    token, start, end = next(scanner.scan_ids(source))
+    assert (scanner.get_tags()[token], start, end) == ("if", 0, 2)
+    with pytest.raises(ValueError):
+        list(scanner.scan_all(b"if!"))
+
+
+def test_native_columns(lexer, tmp_path):
+    scanner = make_native_scanner(lexer, cache_dir=str(tmp_path))
+    source = b"if iffy\n42 else" * 1000
+    expected = lexer.scan_columns(source)
+    assert scanner.scan_columns(source) == expected
+    batches = list(scanner.iter_columns(source, 5, batch_size=7))
+    assert all(len(batch.ids) == 7 for batch in batches[:-1])
+    assert sum((batch.ids.tolist() for batch in batches), []) == \
+        lexer.scan_columns(source, 5).ids.tolist()
+    with pytest.raises(ValueError):
+        scanner.scan_columns(b"if!")
+
+
+def test_native_cache(lexer, tmp_path):
+    make_native_scanner(lexer, cache_dir=str(tmp_path))
+    [path] = tmp_path.iterdir()
+    mtime = path.stat().st_mtime_ns
+    make_native_scanner(lexer, cache_dir=str(tmp_path))
+    assert list(tmp_path.iterdir()) == [path]
+    assert path.stat().st_mtime_ns == mtime
+    make_native_scanner(lexer, "linear", cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 2
@@ -0,0 +1,79 @@
+import pickle
+import random
+
+import pytest
+
+from derivatives import char_range, char_set
+from derivatives.partition import (
+    CHARSET_END, Partition, make_merge_copy_fn, make_merge_fn, merge_all
+)
+
+LEFT = Partition.from_items([(10, "a"), (20, "b"), (CHARSET_END, "c")])
+RIGHT = Partition.from_items([(5, "x"), (20, "y"), (CHARSET_END, "z")])
+
+
+def test_merge():
+    merge = make_merge_copy_fn(str.__add__)
+    assert list(merge(LEFT, RIGHT)) == [
+        (5, "ax"), (10, "ay"), (20, "by"), (CHARSET_END, "cz")
+    ]
+    assert list(merge(LEFT, Partition.single("!"))) == [
+        (10, "a!"), (20, "b!"), (CHARSET_END, "c!")
+    ]
+    assert list(merge(Partition.single("!"), RIGHT)) == [
+        (5, "!x"), (20, "!y"), (CHARSET_END, "!z")
+    ]
+
+
+def test_merge_copies_split_values():
+    def append(left, right):
+        left.append(right)
+        return left
+
+    def append_copy(left, right):
+        return left + [right]
+
+    merge = make_merge_fn(append, append_copy)
+    result = merge(Partition.single([]), RIGHT)
+    result = merge(result, LEFT)
+    assert list(result) == [
+        (5, ["x", "a"]), (10, ["y", "a"]), (20, ["y", "b"]),
+        (CHARSET_END, ["z", "c"])
+    ]
+    assert len({id(value) for value in result.values}) == 4
+
+
+@pytest.mark.parametrize("count", [0, 1, 2, 3, 10])
+def test_merge_all(count):
+    rng = random.Random(count)
+    partitions = []
+    for index in range(count):
+        ends = sorted(rng.sample(range(1, CHARSET_END), 4)) + [CHARSET_END]
+        partitions.append(Partition.from_items(
+            (end, None if rng.random() < 0.5 else (index, end))
+            for end in ends
+        ))
+    expected = [
+        [value for value in (p.lookup(code) for p in partitions) if value]
+        for code in range(CHARSET_END)
+    ]
+    merged = merge_all(partitions)
+    assert [merged.lookup(code) for code in range(CHARSET_END)] == expected
+
+
+def test_lookup_and_coalesce():
+    assert [LEFT.lookup(code) for code in (0, 9, 10, 19, 20, 255)] == [
+        "a", "a", "b", "b", "c", "c"
+    ]
+    partition = Partition.from_items(
+        [(1, True), (2, True), (CHARSET_END, False)]
+    )
+    assert list(partition.coalesce()) == [(2, True), (CHARSET_END, False)]
+    assert pickle.loads(pickle.dumps(partition)) == partition
+
+
+def test_union_ranges_is_canonical():
+    assert (char_set("ab") | char_set("cd")).getvalue() is \
+        char_set("abcd").getvalue()
+    assert (char_range("a", "m") | char_range("n", "z")).getvalue() is \
+        char_range("a", "z").getvalue()
@@ -0,0 +1,55 @@
+import io
+
+import pytest
+
+from derivatives import (
+    Dfa, any_without, char_set, make_lexer, select_first, string
+)
+from derivatives.serialize import dump, dumps, load, loads
+
+
+def test_round_trip(lexer):
+    loaded = loads(dumps(lexer))
+    assert loaded.get_tags() == lexer.get_tags()
+    assert list(loaded.iter_states()) == list(lexer.iter_states())
+    source = b"if iffy\nelse"
+    assert list(loaded.scan_all(source)) == list(lexer.scan_all(source))
+
+
+def test_loads_precomputed_table(monkeypatch):
+    lexer = make_lexer([
+        ("if", string("if")),
+        ("word", any_without(char_set(" \n")).plus()),
+        ("space", char_set(" \n").plus()),
+    ], select_first)
+    loaded = loads(dumps(lexer))
+
+    def fail(*args):
+        raise AssertionError("table rebuilt from states")
+
+    monkeypatch.setattr("derivatives.dfa.make_byte_classes", fail)
+    monkeypatch.setattr("derivatives.dfa.find_self_loops", fail)
+    source = "if iffy\nelse x\u00e9".encode("utf-8") * 100
+    assert list(loaded.scan_all(source)) == list(lexer.scan_all(source))
+    assert loaded.get_self_loops() == lexer.get_self_loops() != {}
+    monkeypatch.undo()
+    assert list(loaded.iter_states()) == list(lexer.iter_states())
+    assert loaded.get_table_columns() == lexer.get_table_columns()
+
+
+def test_file_round_trip(lexer):
+    fp = io.BytesIO()
+    dump(lexer, fp)
+    fp.seek(0)
+    assert list(load(fp).iter_states()) == list(lexer.iter_states())
+
+
+def test_invalid_data(lexer):
+    data = dumps(lexer)
+    with pytest.raises(ValueError):
+        loads(b"garbage" + data)
+    with pytest.raises(ValueError):
+        loads(data[:-1])
+    states = [state for _, state in lexer.iter_states()]
+    with pytest.raises(ValueError):
+        loads(dumps(Dfa(states, lexer.get_tags()[:1])))